@@ -0,0 +1,148 @@
+import zlib
+import struct
+
+# helpers shared by the file format code (pd_data, data) and the addon. This module
+# must not import bpy or anything from the addon, so the parsers can run without Blender
+
+def decompress(buffer):
+    if buffer[0:2] == b'\x11\x73':
+        return zlib.decompress(buffer[5:], wbits=-15)
+    elif buffer[0:2] == b'\x11\x72':
+        return zlib.decompress(buffer[2:], wbits=-15)
+
+    raise Exception('decompress: invalid header (not 1172 or 1173)')
+
+# size of the chunks inflated at a time by decompress_iter
+DECOMPRESS_CHUNK = 0x10000
+
+# the offset of the deflate stream in a compressed segment
+def compressed_start(buffer):
+    if buffer[0:2] == b'\x11\x73':
+        return 5
+    elif buffer[0:2] == b'\x11\x72':
+        return 2
+
+    raise Exception('decompress: invalid header (not 1172 or 1173)')
+
+# the inflated size stored in the 1173 header, None for 1172 segments (no size)
+def inflated_size(buffer):
+    if compressed_start(buffer) == 5:
+        return int.from_bytes(buffer[2:5], 'big')
+
+    return None
+
+# inflates the segment chunksize bytes at a time, yielding each chunk. With maxlen, it stops
+# once maxlen bytes are inflated and the rest of the stream isn't decoded
+def decompress_iter(buffer, chunksize=DECOMPRESS_CHUNK, maxlen=None):
+    data = memoryview(buffer)[compressed_start(buffer):]
+    obj = zlib.decompressobj(wbits=-15)
+    total = 0
+
+    while not obj.eof:
+        size = chunksize if maxlen is None else min(chunksize, maxlen - total)
+        if size <= 0: return
+
+        chunk = obj.decompress(data, size)
+        data = obj.unconsumed_tail
+        if not chunk:
+            if obj.eof: return
+            # all the input was consumed before the end of the stream
+            raise zlib.error('decompress: incomplete or truncated stream')
+
+        total += len(chunk)
+        yield chunk
+
+# inflates the segment into out (a writable buffer: bytearray, memoryview, numpy array...),
+# up to its size. Returns the number of bytes written
+def decompress_into(buffer, out):
+    view = memoryview(out).cast('B')
+    pos = 0
+    for chunk in decompress_iter(buffer, maxlen=len(view)):
+        view[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+
+    return pos
+
+# the first size bytes of the inflated segment (less if it's smaller), ex: to read a file header
+def decompress_head(buffer, size):
+    return b''.join(decompress_iter(buffer, maxlen=size))
+
+def decompressandgetunused(buffer):
+    header = int.from_bytes(buffer[0:2], 'big')
+    assert(header == 0x1173)
+    obj = zlib.decompressobj(wbits=-15)
+    bindata = obj.decompress(buffer[5:])
+    return bindata, obj.unused_data
+
+# compression profiles: fast for iteration builds, max for the smallest files
+COMPRESS_FAST = 'fast'
+COMPRESS_DEFAULT = 'default'
+COMPRESS_MAX = 'max'
+
+CompressLevels = {
+    COMPRESS_FAST: 1,
+    COMPRESS_DEFAULT: zlib.Z_DEFAULT_COMPRESSION,
+}
+
+# the (level, memLevel, strategy) tried by the max profile, the smallest stream is kept.
+# All of them are plain deflate streams the game's inflater reads
+CompressMaxTrials = [
+    (9, 9, zlib.Z_DEFAULT_STRATEGY),
+    (9, 9, zlib.Z_FILTERED),
+    (9, 9, zlib.Z_RLE),
+    (9, 9, zlib.Z_FIXED),
+]
+
+def deflate(data, level=zlib.Z_DEFAULT_COMPRESSION, memlevel=zlib.DEF_MEM_LEVEL, strategy=zlib.Z_DEFAULT_STRATEGY):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, memlevel, strategy)
+    stream = compressor.compress(data)
+    stream += compressor.flush()
+    return stream
+
+def compress(data, profile=COMPRESS_DEFAULT):
+    if profile == COMPRESS_MAX:
+        stream = min((deflate(data, *trial) for trial in CompressMaxTrials), key=len)
+    elif profile in CompressLevels:
+        stream = deflate(data, CompressLevels[profile])
+    else:
+        raise Exception(f'compress: unknown profile {profile}')
+
+    return b'\x11\x73' + len(data).to_bytes(3, 'big') + stream
+
+def ALIGN8(addr):
+    return ((addr + 0x7) | 0x7) ^ 0x7
+
+def align(addr, alignment):
+    m = alignment - 1
+    return ((addr + m) | m) ^ m
+
+def read_file(filename, autodecomp=True):
+    with open(filename, 'rb') as fd:
+        data = fd.read()
+
+    if autodecomp and data[0:2] == b'\x11\x73':
+        data = zlib.decompress(data[5:], wbits=-15)
+
+    return data
+
+def write_file(filename, data, log=True):
+    fd = open(f'{filename}', 'wb')
+    fd.write(data)
+    fd.close()
+
+    if log: print(f'file written: {filename}')
+
+def s8(value):
+    return struct.unpack('b', value.to_bytes(1, 'little'))[0]
+
+def s16(value):
+    return struct.unpack('h', value.to_bytes(2, 'little'))[0]
+
+def s32(value):
+    return struct.unpack('i', value.to_bytes(4, 'little'))[0]
+
+def f32(value):
+    return struct.unpack('f', value.to_bytes(4, 'little'))[0]
+
+def u32(value):
+    return struct.unpack('I', value.to_bytes(4, 'little'))[0]
@@ -1,16 +1,67 @@
+import numpy as np
+
 class BitReader:
+    # bits are read msb first. The accumulator is refilled 8 bytes at a time
+    # and only holds the accum_nbits bits not read yet
     def __init__(self, buffer):
         self.buffer = buffer
         self.accum_value = 0
         self.accum_nbits = 0
         self.idx = 0
+    def refill(self):
+        chunk = self.buffer[self.idx:self.idx + 8]
+        if not len(chunk):
+            raise IndexError('BitReader: read past the end of the buffer')
+
+        self.accum_value = (self.accum_value & ((1 << self.accum_nbits) - 1)) << (len(chunk) * 8) | int.from_bytes(chunk, 'big')
+        self.idx += len(chunk)
+        self.accum_nbits += len(chunk) * 8
     def read(self, nbits):
         while self.accum_nbits < nbits:
-            self.accum_value = self.buffer[self.idx] | (self.accum_value << 8)
-            self.idx += 1
-            self.accum_nbits += 8
+            self.refill()
 
         self.accum_nbits -= nbits
         return (self.accum_value >> self.accum_nbits) & ((1 << nbits) - 1)
+    # returns the next nbits without consuming them, the bits past the end of the buffer are 0
+    def peek(self, nbits):
+        while self.accum_nbits < nbits and self.idx < len(self.buffer):
+            self.refill()
+
+        mask = (1 << nbits) - 1
+        if self.accum_nbits < nbits:
+            return (self.accum_value << (nbits - self.accum_nbits)) & mask
+
+        return (self.accum_value >> (self.accum_nbits - nbits)) & mask
+    # position of the next bit to read
+    def tell(self):
+        return self.idx * 8 - self.accum_nbits
+    def seek(self, pos):
+        self.idx = pos >> 3
+        self.accum_value = 0
+        self.accum_nbits = 0
+        if pos & 7:
+            self.read(pos & 7)
+    # reads count codes of nbits each (up to 57), returns them in an int64 array
+    def read_many(self, nbits, count):
+        pos = self.tell()
+        end = pos + nbits * count
+        if end > len(self.buffer) * 8:
+            raise IndexError('BitReader: read past the end of the buffer')
+
+        if nbits == 0 or count == 0:
+            return np.zeros(count, dtype=np.int64)
+
+        # the bytes covering the codes, padded so each code can be read from the 8 bytes it starts in
+        first, last = pos >> 3, (end + 7) >> 3
+        data = np.zeros(last - first + 7, dtype=np.uint8)
+        data[:last - first] = np.frombuffer(self.buffer, dtype=np.uint8, count=last - first, offset=first)
+        words = np.ndarray(shape=(last - first,), dtype='>u8', buffer=data, strides=(1,))
+
+        starts = np.arange(count, dtype=np.int64) * nbits + (pos & 7)
+        codes = words[starts >> 3] >> (64 - nbits - (starts & 7)).astype(np.uint64)
+
+        self.seek(end)
+        return (codes & np.uint64((1 << nbits) - 1)).astype(np.int64)
+    # the remaining data, starting at the first byte not fully read
     def cur_buffer(self):
-        return self.buffer[self.idx:]
+        return self.buffer[self.idx - self.accum_nbits // 8:]
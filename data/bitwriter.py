@@ -0,0 +1,38 @@
+import numpy as np
+
+class BitWriter:
+    # bits are written msb first, the reverse of BitReader. The codes are kept
+    # as (values, nbits) arrays and only packed into bytes by getbuffer
+    def __init__(self):
+        self.values = []
+        self.nbits = []
+        self.size = 0
+    def write(self, value, nbits):
+        self.values.append(value)
+        self.nbits.append(nbits)
+        self.size += nbits
+    # writes the codes of values (an array), nbits each
+    def write_many(self, values, nbits):
+        values = np.asarray(values, dtype=np.int64).ravel()
+        self.values.extend(values.tolist())
+        self.nbits.extend([nbits] * len(values))
+        self.size += nbits * len(values)
+    def write_bytes(self, data):
+        self.write_many(np.frombuffer(bytes(data), dtype=np.uint8), 8)
+    # number of bits written
+    def tell(self):
+        return self.size
+    # the bits written, the last byte is padded with 0s
+    def getbuffer(self):
+        values = np.array(self.values, dtype=np.int64)
+        nbits = np.array(self.nbits, dtype=np.int64)
+        maxbits = int(nbits.max()) if len(nbits) else 0
+        if maxbits > 63:
+            raise ValueError('BitWriter: codes are limited to 63 bits')
+
+        # one row of maxbits bits per code, right aligned: only the last nbits are kept
+        shifts = np.arange(maxbits - 1, -1, -1, dtype=np.int64)
+        bits = (values[:, None] >> shifts) & 1
+        keep = shifts < nbits[:, None]
+
+        return np.packbits(bits[keep].astype(np.uint8)).tobytes()
@@ -1,10 +1,22 @@
-from .datablock import DataBlock
+import struct
+
+import numpy as np
+
+from .datablock import DataBlock, BlockSource
 import data.typeinfo as tpi
+import data.structcodec as stc
 
 
 class ByteStream:
-    def __init__(self, data, src_BO = 'big', dest_BO = 'big'):
-        self.data = data
+    # zerocopy: wrap the data in a memoryview, so raw blocks and arrays read from it
+    # are views into the source buffer instead of copies
+    # lazy: blocks only record their offset into the data, each field is decoded when first
+    # accessed. Blocks with arrays of undetermined size are always read eagerly
+    def __init__(self, data, src_BO = 'big', dest_BO = 'big', zerocopy = False, lazy = False):
+        self.zerocopy = zerocopy
+        self.lazy = lazy
+        self.src = None
+        self.data = self.wrap(data)
         self.buffer = None
         self.cursor = 0
         self.fd = ''
@@ -12,8 +24,14 @@ class ByteStream:
         self.src_BO = src_BO
         self.dest_BO = dest_BO
 
+    def wrap(self, data):
+        if not self.zerocopy or data is None or isinstance(data, memoryview):
+            return data
+
+        return memoryview(data)
+
     def set_data(self, data):
-        self.data = data
+        self.data = self.wrap(data)
         self.cursor = 0
 
     def set_buffer(self, buffer:bytearray):
@@ -23,11 +41,66 @@ class ByteStream:
         self.cursor = cursor
 
     def read_block(self, decl_name, endmarker = None):
-        decl = tpi.TypeInfo.decl_map[decl_name]
-        block = DataBlock(decl_name, self.cursor)
-        for typename in decl:
-            val, info = self.read(typename, endmarker)
-            block.add_field(info, val)
+        codec = tpi.TypeInfo.codec(decl_name)
+        start = self.cursor
+
+        if self.lazy and codec.fixed_size and start + codec.size <= len(self.data):
+            return self.read_lazy(codec)
+
+        try:
+            return self.read_codec(codec, endmarker)
+        except struct.error:
+            # the block goes past the end of the data: read it field by field,
+            # decoding whatever bytes are left like read_primitive does
+            self.cursor = start
+            block = DataBlock(decl_name, start, codec=codec)
+            for field in codec.fields:
+                val = self.read_field(field.info, endmarker)
+                block.add_field(field.info, val)
+
+            return block
+
+    # the BlockSource for the current data, shared by all the blocks read from it
+    def source(self):
+        if self.src is None or self.src.data is not self.data:
+            self.src = BlockSource(self.data, self.src_BO)
+
+        return self.src
+
+    def read_lazy(self, codec):
+        block = DataBlock(codec.name, self.cursor, codec=codec, src=self.source())
+        self.cursor += codec.size
+        return block
+
+    def read_codec(self, codec, endmarker = None):
+        data = self.data
+        bo = self.src_BO
+
+        block = DataBlock(codec.name, self.cursor, codec=codec, src=self.source())
+        values = block.values
+
+        for step in codec.steps:
+            kind = step.kind
+            if kind == stc.STEP_RUN:
+                rd_struct = step.rd_structs[bo]
+                unpacked = rd_struct.unpack_from(data, self.cursor)
+                if step.slot_range:
+                    values[step.slot_range] = unpacked
+                else:
+                    for slot, val in zip(step.slots, unpacked): values[slot] = val
+                self.cursor += rd_struct.size
+            elif kind == stc.STEP_ARRAY:
+                rd_struct = step.rd_structs[bo]
+                values[step.slot] = list(rd_struct.unpack_from(data, self.cursor))
+                self.cursor += rd_struct.size
+            elif kind == stc.STEP_STRUCT:
+                values[step.slot] = self.read_codec(step.codec)
+            elif kind == stc.STEP_STRUCTARRAY:
+                values[step.slot] = [self.read_codec(step.codec) for _ in range(step.count)]
+            else:
+                dataout = []
+                self.read_array(dataout, step.fields[0].info, endmarker)
+                values[step.slot] = dataout
 
         return block
 
@@ -41,7 +114,9 @@ class ByteStream:
 
     def read(self, decl, endmarker = None):
         info = tpi.field_info(decl)
+        return self.read_field(info, endmarker), info
 
+    def read_field(self, info, endmarker = None):
         typename = info['typename']
         is_struct = info['is_struct']
         is_array = info['is_array']
@@ -51,9 +126,9 @@ class ByteStream:
         if is_array:
             dataout = []
             self.read_array(dataout, info, endmarker)
-            return dataout, info
+            return dataout
         else:
-            return read_func(typename), info
+            return read_func(typename)
 
     def read_array(self, dataout, info, endmarker):
         typename = info['typename']
@@ -75,10 +150,12 @@ class ByteStream:
             marker = self.read_primitive(markertype)
             if 'includelast' in endmarker:
                 dataout.append(marker)
-        else:
+        elif is_struct:
             for i in range(0, array_size):
                 val = read_func(typename)
                 dataout.append(val)
+        else:
+            dataout += self.read_primitives(typename, array_size)
 
     def read_primitive(self, typename):
         size = tpi.TypeInfo.sizeof(typename)
@@ -86,66 +163,140 @@ class ByteStream:
         addr = self.cursor
         self.cursor += size
 
-        val = self.data[addr:addr+size]
-        return int.from_bytes(val, self.src_BO)
+        try:
+            return stc.primitive_struct(size, self.src_BO).unpack_from(self.data, addr)[0]
+        except struct.error:
+            # past the end of the data, decode whatever bytes are left
+            return int.from_bytes(self.data[addr:addr+size], self.src_BO)
 
-    def peek(self, typename, n = 1):
+    # reads n primitives of the same type with a single unpack
+    def read_primitives(self, typename, n):
         size = tpi.TypeInfo.sizeof(typename)
+
         addr = self.cursor
-        values = []
+        self.cursor += size * n
+
+        try:
+            return list(struct.unpack_from(stc.primitive_fmt(size, self.src_BO, n), self.data, addr))
+        except struct.error:
+            data = self.data
+            return [int.from_bytes(data[a:a+size], self.src_BO) for a in range(addr, addr + size * n, size)]
+
+    # reads n primitives into a numpy array. Unlike the other read functions, the values
+    # are typed after the declaration (s16 -> int16, f32 -> float32) and, when possible,
+    # the array is a read-only view into the data, not a copy
+    def read_ndarray(self, typename, n):
+        size = tpi.TypeInfo.sizeof(typename)
+        dtype = stc.numpy_dtype(typename, size, self.src_BO)
 
-        for i in range(n):
-            val = self.data[addr:addr+size]
-            values.append(int.from_bytes(val, self.src_BO))
-            addr += size
+        addr = self.cursor
+        self.cursor += size * n
 
-        return values if n > 1 else values[0]
+        return np.frombuffer(self.data, dtype=dtype, count=n, offset=addr)
 
-    def write(self, dataout, val, typename):
-        nbytes = tpi.TypeInfo.sizeof(typename)
-        __addr = len(dataout)
-        __addrrel = __addr - self.ref
-        __v = val
-        signed = typename in ['s8', 's16', 's32', 's64']
-        val = val.to_bytes(nbytes, self.dest_BO, signed=signed)
-
-        dataout += bytearray(val)
+    def peek(self, typename, n = 1):
+        cursor = self.cursor
+        values = self.read_primitives(typename, n)
+        self.cursor = cursor
 
-    def write_block(self, dataout, block, pad=0, reread_arraysize=False):
-        block.write_addr = len(dataout)
+        return values if n > 1 else values[0]
 
-        decl_name = block.name
-        decl = tpi.TypeInfo.get_decl(decl_name)
-        for field in decl:
-            info = tpi.field_info(field)
-
-            typename = info['typename']
-            fieldname = info['fieldname']
-            is_pointer = info['is_pointer']
-            is_struct = info['is_struct']
-            is_array = info['is_array']
-            array_size = info['array_size']
-
-            if is_array:
-                array_size = array_size if reread_arraysize else len(block[fieldname])
-                for i in range(0, array_size):
-                    memdata = block[fieldname][i]
-                    if is_struct:
-                        self.write_block(dataout, memdata)
-                    else:
-                        self.fd = f'{fieldname}[{i}]'
-                        self.write(dataout, memdata, typename)
-            elif is_struct and not is_pointer:
-                self.write_block(dataout, block[fieldname])
+    def write(self, dataout, val, typename):
+        size = tpi.TypeInfo.sizeof(typename)
+        signed = typename in stc.SIGNED_TYPES
+        dataout += stc.primitive_struct(size, self.dest_BO, 1, signed).pack(val)
+
+    # size of the block once written. Only blocks with arrays or structs need to look
+    # at their values, arrays may not have the declared size
+    def block_size(self, block, reread_arraysize=False):
+        codec = block.codec
+        if not codec.nested or block.clean():
+            return codec.size
+
+        values = block.load()
+        size = codec.size
+        for step in codec.varsteps:
+            field = step.fields[0]
+            items = values[step.slot]
+            if step.kind == stc.STEP_STRUCT:
+                size += self.block_size(items) - field.size
+                continue
+
+            n = step.count if reread_arraysize else len(items)
+            if step.codec:
+                size += sum(self.block_size(items[i]) for i in range(n))
+            else:
+                size += n * field.size
+
+            size -= field.size * step.count
+
+        return size
+
+    # layout pass: the offset each block will be written at, starting from 'start',
+    # and the offset where the last one ends (aligned to 'pad')
+    def layout(self, blocks, start=0, pad=0, reread_arraysize=False):
+        offsets = []
+        ofs = start
+        for block in blocks:
+            offsets.append(ofs)
+            ofs += self.block_size(block, reread_arraysize)
+
+        return offsets, align(ofs, pad)
+
+    # serializes the block into buf at ofs, which must be already allocated,
+    # returns the offset following the block
+    def pack_block(self, buf, ofs, block, reread_arraysize=False):
+        block.write_addr = ofs
+        codec = block.codec
+
+        # blocks that weren't modified since they were read are copied as they are
+        if block.clean() and block.src.bo == self.dest_BO:
+            end = ofs + codec.size
+            buf[ofs:end] = block.src.data[block.addr:block.addr + codec.size]
+            return end
+
+        values = block.load()
+        bo = self.dest_BO
+
+        for step in codec.steps:
+            kind = step.kind
+            if kind == stc.STEP_RUN:
+                if step.slot_range:
+                    run = values[step.slot_range]
+                else:
+                    run = [values[slot] for slot in step.slots]
+                wr_struct = step.wr_structs[bo]
+                wr_struct.pack_into(buf, ofs, *run)
+                ofs += wr_struct.size
+            elif kind == stc.STEP_STRUCT:
+                ofs = self.pack_block(buf, ofs, values[step.slot])
             else:
-                self.fd = fieldname
-                self.write(dataout, block[fieldname], typename)
+                items = values[step.slot]
+                n = step.count if reread_arraysize else len(items)
+                if step.codec:
+                    for i in range(0, n):
+                        ofs = self.pack_block(buf, ofs, items[i])
+                elif n > 0:
+                    wr_struct = step.array_struct(n, bo)
+                    wr_struct.pack_into(buf, ofs, *items[:n])
+                    ofs += wr_struct.size
+
+        return ofs
+
+    # writes the blocks one after the other: dataout is grown once to its final size
+    # and each block is then packed in place
+    def write_blocks(self, dataout, blocks, pad=0, reread_arraysize=False):
+        offsets, end = self.layout(blocks, len(dataout), pad, reread_arraysize)
+        dataout += bytes(end - len(dataout))
+
+        for block, ofs in zip(blocks, offsets):
+            self.pack_block(dataout, ofs, block, reread_arraysize)
 
-        add_padding(dataout, pad)
+    def write_block(self, dataout, block, pad=0, reread_arraysize=False):
+        self.write_blocks(dataout, [block], pad, reread_arraysize)
 
     def write_block_list(self, dataout, decl, blocklist, endmarker=None, pad=0, dbg=0):
-        for block in blocklist:
-            self.write_block(dataout, block)
+        self.write_blocks(dataout, blocklist)
 
         if endmarker is not None:
             self.write(dataout, endmarker[1], endmarker[0])
@@ -158,12 +309,19 @@ class ByteStream:
         dataout += block.bytes
         add_padding(dataout, pad)
 
+# zeros to pad the data with, without allocating them each time
+ZEROS = memoryview(bytes(0x40))
+
+def align(ofs, pad):
+    if pad == 0: return ofs
+
+    return (ofs + (pad-1)) & ~(pad - 1)
+
 def add_padding(dataout, pad):
     if pad == 0: return
 
     size = len(dataout)
-    alignedsize = (size + (pad-1)) & ~(pad - 1)
-    diff = alignedsize - size
+    diff = align(size, pad) - size
 
     if diff > 0:
-        dataout += bytearray(diff)
+        dataout += ZEROS[:diff] if diff <= len(ZEROS) else bytes(diff)
@@ -1,62 +1,165 @@
 import data.typeinfo as tpi
+import data.structcodec as stc
+
+# value of the fields of a lazy block that haven't been decoded yet
+UNREAD = object()
+
+
+# the buffer lazy blocks are decoded from
+class BlockSource:
+    __slots__ = ('data', 'bo')
+
+    def __init__(self, data, bo):
+        self.data = data
+        self.bo = bo
+
 
 class DataBlock:
-    def __init__(self, name, addr, data = None):
+    # a level has tens of thousands of blocks, so they don't carry a __dict__: field values
+    # are kept in a list, indexed through the slots of the type's codec, which is shared
+    # by all blocks of the same type. Fields that aren't part of the declaration (added
+    # after the block is read, ex: room['gfxdata']) go to 'extra'
+    __slots__ = ('name', 'addr', 'write_addr', 'bytes', 'codec', 'values', 'extra', 'src', 'dirty')
+
+    # src: the BlockSource the block was read from. Lazy blocks decode their fields from it
+    # when first accessed, and blocks that weren't modified are written back as a copy of it
+    def __init__(self, name, addr, data = None, codec = None, src = None):
         self.name = name
         self.addr = addr
         self.write_addr = None
-        self.fields = {}
-        self.field_infos = {}
         self.bytes = data
+        self.codec = codec
+        self.values = [UNREAD if src else None] * len(codec.slots) if codec else None
+        self.extra = None
+        self.src = src
+        self.dirty = False
 
     # create a new empty block (all fields set to zero)
     @staticmethod
     def New(decl_name):
-        datablock = DataBlock(decl_name, 0)
-        decl = tpi.TypeInfo.get_decl(decl_name)
-        for typename in decl:
-            info = tpi.field_info(typename)
-            if info['is_struct']:
-                if info['is_array']:
-                    n = info['array_size']
-                    array = [DataBlock.New(info['typename']) for _ in range(n)]
-                    datablock.add_field(info, array)
+        codec = tpi.TypeInfo.codec(decl_name)
+        datablock = DataBlock(decl_name, 0, codec=codec)
+        values = datablock.values
+        for field in codec.fields:
+            if field.is_struct:
+                if field.is_array:
+                    values[field.slot] = [DataBlock.New(field.typename) for _ in range(field.count)]
                 else:
-                    datablock.add_field(info, DataBlock.New(info['typename']))
-            elif info['is_array']:
-                datablock.add_field(info, [0] * info['array_size'])
+                    values[field.slot] = DataBlock.New(field.typename)
+            elif field.is_array:
+                values[field.slot] = [0] * field.count
             else:
-                datablock.add_field(info, 0)
+                values[field.slot] = 0
 
         return datablock
 
+    @property
+    def fields(self):
+        fields = {}
+        if self.codec:
+            values = self.load()
+            fields = {name: values[slot] for name, slot in self.codec.slots.items()}
+        if self.extra:
+            fields.update(self.extra)
+
+        return fields
+
+    @property
+    def field_infos(self):
+        return self.codec.infos if self.codec else {}
+
+    # decodes a field of a lazy block
+    def decode(self, slot):
+        field = self.codec.slotfields[slot]
+        src = self.src
+        addr = self.addr + field.offset
+
+        if field.is_struct:
+            codec = field.codec
+            if field.is_array:
+                return [DataBlock(codec.name, addr + i * field.size, codec=codec, src=src) for i in range(field.count)]
+
+            return DataBlock(codec.name, addr, codec=codec, src=src)
+
+        values = field.rd_structs[src.bo].unpack_from(src.data, addr)
+        return list(values) if field.is_array else values[0]
+
+    # decodes all the fields not read yet and returns the values
+    def load(self):
+        values = self.values
+        if self.src is not None:
+            for slot, val in enumerate(values):
+                if val is UNREAD:
+                    values[slot] = self.decode(slot)
+
+        return values
+
+    # true if the block was read from a source and wasn't modified since,
+    # in which case it can be written back by copying its bytes
+    def clean(self):
+        codec = self.codec
+        if self.dirty or self.src is None or not codec.fixed_size: return False
+
+        # arrays and structs can be modified in place, so they're checked as well
+        for field in codec.nested:
+            val = self.values[field.slot]
+            if val is UNREAD: continue
+
+            if not field.is_struct:
+                if val != self.decode(field.slot): return False
+                continue
+
+            blocks = val if field.is_array else [val]
+            if not isinstance(blocks, list) or len(blocks) != field.count: return False
+
+            addr = self.addr + field.offset
+            for block in blocks:
+                if not isinstance(block, DataBlock) or block.src is not self.src: return False
+                if block.addr != addr or not block.clean(): return False
+                addr += field.size
+
+        return True
+
     def add_field(self, info, value):
-        self.fields[info['fieldname']] = value
-        self.field_infos[info['fieldname']] = info
+        self[info['fieldname']] = value
 
     # updates the value of 'field' and also serialize it to dataout
     def update(self, dataout, field, value, signed=False):
         self[field] = value
-        info = self.field_infos[field]
-        typename = info['typename']
+        codec = self.codec
+        fieldcodec = codec.fieldmap[field]
+        addr = self.write_addr + codec.offsets[field]
 
-        size = tpi.TypeInfo.sizeof(typename)
-        offset = tpi.TypeInfo.offsetof(self.name, field)
-        addr = self.write_addr + offset
-
-        if info['is_array']:
-            for val in value:
-                dataout[addr:addr + size] = val.to_bytes(size, 'big', signed=signed) # TODO config
-                addr += size
-        else:
-            dataout[addr:addr + size] = value.to_bytes(size, 'big', signed=signed)
+        values = value if fieldcodec.is_array else [value]
+        wr_struct = stc.primitive_struct(fieldcodec.size, 'big', len(values), signed) # TODO config
+        wr_struct.pack_into(dataout, addr, *values)
 
     def __getitem__(self, key):
-        return self.fields[key]
+        if self.codec:
+            slot = self.codec.slots.get(key)
+            if slot is not None:
+                val = self.values[slot]
+                if val is UNREAD:
+                    val = self.values[slot] = self.decode(slot)
+                return val
+
+        if self.extra is None:
+            raise KeyError(key)
+
+        return self.extra[key]
 
     def __setitem__(self, key, value):
-        self.fields[key] = value
+        if self.codec:
+            slot = self.codec.slots.get(key)
+            if slot is not None:
+                self.values[slot] = value
+                self.dirty = True
+                return
+
+        if self.extra is None:
+            self.extra = {}
+
+        self.extra[key] = value
 
     def __repr__(self):
         return str(self.fields)
-
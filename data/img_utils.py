@@ -0,0 +1,135 @@
+import zlib
+import struct
+
+import numpy as np
+
+# zlib level of the PNGs written, the images are small and can be decoded again from the rom,
+# so speed matters more than size. 9 gives the smallest files
+PNG_LEVEL = 2
+
+# PNG color type of each number of channels
+PNG_COLORTYPES = {2: 4, 3: 2, 4: 6}
+
+# the first count values of colors (a list, an array or a bytes-like object) as an int64 array
+def pixel_values(colors, count):
+    if isinstance(colors, (bytes, bytearray, memoryview)):
+        values = np.frombuffer(colors, dtype=np.uint8, count=min(count, len(colors)))
+    else:
+        values = np.asarray(colors[:count])
+
+    if len(values) < count:
+        raise IndexError(f'pixel_values: {count} values needed, {len(values)} given')
+
+    return values.astype(np.int64)
+
+# the values as a bytearray, they must fit in a byte
+def to_bytes(values):
+    values = np.asarray(values, dtype=np.int64)
+    if values.size and (values.min() < 0 or values.max() > 255):
+        raise ValueError('to_bytes: byte must be in range(0, 256)')
+
+    return bytearray(values.astype(np.uint8).tobytes())
+
+def png_pack(png_tag, data):
+    chunk_head = png_tag + data
+    return struct.pack("!I", len(data)) + chunk_head + struct.pack("!I", 0xFFFFFFFF & zlib.crc32(chunk_head))
+
+# the rows of buf are written bottom-up
+def png_encode(buf, width, height, channels, level=PNG_LEVEL):
+    rowsize = width * channels
+    pixels = np.zeros(rowsize * height, dtype=np.uint8)
+    data = np.frombuffer(buf, dtype=np.uint8, count=min(len(buf), len(pixels)))
+    pixels[:len(data)] = data
+
+    # each scanline starts with its filter type (0: none)
+    rows = np.zeros((height, rowsize + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels.reshape(height, rowsize)[::-1]
+
+    return b"".join([
+        b'\x89PNG\r\n\x1a\n',
+        png_pack(b'IHDR', struct.pack("!2I5B", width, height, 8, PNG_COLORTYPES[channels], 0, 0, 0)),
+        png_pack(b'IDAT', zlib.compress(rows.tobytes(), level)),
+        png_pack(b'IEND', b'')])
+
+def png_rgba32(buf, width, height, level=PNG_LEVEL):
+    return png_encode(buf, width, height, 4, level)
+
+def png_ia16(buf, width, height, level=PNG_LEVEL):
+    return png_encode(buf, width, height, 2, level)
+
+def png_rgb24(buf, width, height, level=PNG_LEVEL):
+    return png_encode(buf, width, height, 3, level)
+
+# the pixels of buf as an RGBA (width*height, 4) uint8 array, missing channels are 255
+# and the 2 channel images are intensity + alpha
+def rgba32(buf, width, height, channels):
+    pixels = np.zeros(width * height * channels, dtype=np.uint8)
+    data = np.frombuffer(buf, dtype=np.uint8, count=min(len(buf), len(pixels)))
+    pixels[:len(data)] = data
+    pixels = pixels.reshape(-1, channels)
+
+    rgba = np.full((width * height, 4), 255, dtype=np.uint8)
+    if channels == 2:
+        rgba[:, 0:3] = pixels[:, 0:1]
+        rgba[:, 3] = pixels[:, 1]
+    else:
+        rgba[:, 0:channels] = pixels
+
+    return rgba
+
+# the pixels of buf as RGBA floats in [0, 1], the layout of bpy.types.Image.pixels
+# (rows bottom-up, so in the same order as buf since the PNGs are written flipped)
+def rgba_float(buf, width, height, channels):
+    rgba = rgba32(buf, width, height, channels)
+    return (rgba.astype(np.float32) / 255).ravel()
+
+def rgba16_to_rgba32(colors, numpixels):
+    values = pixel_values(colors, numpixels * 2)
+    rgba16 = values[0::2] << 8 | values[1::2]
+    r = (rgba16 >> 11) & 0x1f
+    g = (rgba16 >> 6) & 0x1f
+    b = (rgba16 >> 1) & 0x1f
+
+    return to_bytes(np.stack([r * 8, g * 8, b * 8, (rgba16 & 1) * 255], axis=1))
+
+def rgb15_to_rgb24(colors, numpixels):
+    values = pixel_values(colors, numpixels * 2)
+    rgb15 = values[0::2] << 8 | values[1::2]
+    r = (rgb15 >> 11) & 0x1f
+    g = (rgb15 >> 6) & 0x1f
+    b = (rgb15 >> 1) & 0x1f
+
+    return to_bytes(np.stack([r * 8, g * 8, b * 8], axis=1))
+
+def ia8_to_ia16(colors, numpixels):
+    values = pixel_values(colors, numpixels)
+    return to_bytes(np.stack([((values >> 4) & 0xf) * 16, (values & 0xf) * 16], axis=1))
+
+def ia8_to_rgba32(colors, numpixels):
+    values = pixel_values(colors, numpixels)
+    val = ((values >> 4) & 0xf) * 16
+    a = (values & 0xf) * 16
+
+    return to_bytes(np.stack([val, val, val, a], axis=1))
+
+def ia4_to_ia16(colors, numpixels):
+    values = pixel_values(colors, numpixels)
+    val = ((values >> 1) & 7) * 32
+    a = (values & 1) * 255
+
+    return to_bytes(np.stack([val, a], axis=1))
+
+def ia16_to_rgba32(colors, numpixels):
+    values = pixel_values(colors, numpixels * 2)
+    val = values[0::2]
+    a = values[1::2]
+
+    return to_bytes(np.stack([val, val, val, a], axis=1))
+
+def i8_to_rgb24(colors, numpixels):
+    values = pixel_values(colors, numpixels)
+    return to_bytes(np.repeat(values, 3))
+
+def i4_to_rgb24(colors, numpixels):
+    values = pixel_values(colors, numpixels)
+    return to_bytes(np.repeat(values * 16, 3))
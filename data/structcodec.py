@@ -0,0 +1,179 @@
+import struct
+from functools import cache
+
+import data.typeinfo as tpi
+
+SIGNED_TYPES = ['s8', 's16', 's32', 's64']
+
+FMT_UNSIGNED = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+FMT_SIGNED = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+FMT_BO = {'big': '>', 'little': '<'}
+
+# kinds of steps a codec is made of
+STEP_RUN         = 0 # consecutive scalar primitives, (un)packed with a single struct
+STEP_ARRAY       = 1 # fixed-size array of primitives
+STEP_STRUCT      = 2 # nested struct
+STEP_STRUCTARRAY = 3 # fixed-size array of structs
+STEP_OPENARRAY   = 4 # array of undetermined size, read up to an endmarker
+
+
+def make_structs(fmt):
+    return {bo: struct.Struct(f'{prefix}{fmt}') for bo, prefix in FMT_BO.items()}
+
+def primitive_fmt(size, bo, count=1, signed=False):
+    fmts = FMT_SIGNED if signed else FMT_UNSIGNED
+    return f'{FMT_BO[bo]}{count}{fmts[size]}'
+
+@cache
+def primitive_struct(size, bo, count=1, signed=False):
+    return struct.Struct(primitive_fmt(size, bo, count, signed))
+
+def numpy_dtype(typename, size, bo):
+    if typename in ['f32', 'f64']:
+        kind = 'f'
+    elif typename in SIGNED_TYPES:
+        kind = 'i'
+    else:
+        kind = 'u'
+
+    return f'{FMT_BO[bo]}{kind}{size}'
+
+
+class FieldCodec:
+    def __init__(self, info, offset, size):
+        self.info = info
+        self.name = info['fieldname']
+        self.typename = info['typename']
+        self.is_struct = info['is_struct']
+        self.is_array = info['is_array']
+        self.count = info['array_size'] if self.is_array else 1
+        self.offset = offset
+        self.size = size # size of a single element
+        self.signed = self.typename in SIGNED_TYPES
+        self.slot = None # index of the value in DataBlock.values
+        self.codec = tpi.TypeInfo.codec(self.typename) if self.is_struct else None
+        self.rd_structs = None
+        self.wr_structs = None
+
+        if not self.is_struct and self.count > 0:
+            self.rd_structs = make_structs(f'{self.count}{self.fmt(False)}')
+            self.wr_structs = make_structs(f'{self.count}{self.fmt(self.signed)}')
+
+    def fmt(self, signed):
+        fmts = FMT_SIGNED if signed else FMT_UNSIGNED
+        if self.size not in fmts:
+            raise Exception(f'unsupported primitive size for field {self.name}: {self.size}')
+
+        return fmts[self.size]
+
+
+class CodecStep:
+    def __init__(self, kind, fields):
+        self.kind = kind
+        self.fields = fields
+        self.names = [f.name for f in fields]
+        self.name = self.names[0]
+        self.slots = [f.slot for f in fields]
+        self.slot = self.slots[0]
+        self.count = fields[0].count
+
+        # the values of a run are usually in consecutive slots, so they can be sliced
+        contiguous = self.slots == list(range(self.slot, self.slot + len(fields)))
+        self.slot_range = slice(self.slot, self.slot + len(fields)) if contiguous else None
+        self.rd_structs = None
+        self.wr_structs = None
+
+        field = fields[0]
+        if kind == STEP_RUN:
+            self.rd_structs = make_structs(''.join(f.fmt(False) for f in fields))
+            self.wr_structs = make_structs(''.join(f.fmt(f.signed) for f in fields))
+        elif kind == STEP_ARRAY:
+            self.rd_structs = field.rd_structs
+            self.wr_structs = field.wr_structs
+
+        self.codec = field.codec
+
+    # struct used to write n elements of a primitive array, n may differ from the declared size
+    def array_struct(self, n, bo):
+        if n == self.count:
+            return self.wr_structs[bo]
+
+        field = self.fields[0]
+        return primitive_struct(field.size, bo, n, field.signed)
+
+
+class StructCodec:
+    """
+    A declaration compiled once into the offsets and structs needed to (de)serialize it,
+    so ByteStream doesn't have to parse the declaration strings for every block it reads.
+    Consecutive scalar primitives are grouped into a single struct.Struct, arrays of
+    primitives are decoded in one call and structs point to their own (nested) codec.
+    """
+    def __init__(self, name, decl):
+        self.name = name
+        self.fields = []
+        self.fieldmap = {}
+        self.infos = {}
+        self.offsets = {}
+        self.slots = {}
+        self.steps = []
+
+        ofs = 0
+        for field in decl:
+            info = tpi.field_info(field)
+            typename = info['typename']
+
+            if info['is_struct']:
+                size, _ = tpi.TypeInfo._struct_size(typename)
+            else:
+                size = tpi.TypeInfo.sizeof(typename)
+
+            fieldcodec = FieldCodec(info, ofs, size)
+            self.fields.append(fieldcodec)
+
+            # fields with the same name share a slot, the last one read wins
+            fieldcodec.slot = self.slots.setdefault(fieldcodec.name, len(self.slots))
+
+            # same semantics as DataBlock.add_field and TypeInfo.offsetof
+            self.fieldmap[fieldcodec.name] = fieldcodec
+            self.infos[fieldcodec.name] = info
+            self.offsets.setdefault(fieldcodec.name, ofs)
+
+            ofs += size * fieldcodec.count
+
+        self.size = ofs
+        # blocks with arrays of undetermined size can't be decoded lazily, their size is only known once read
+        self.fixed_size = all(f.count > 0 for f in self.fields if f.is_array)
+        # the field decoded into each slot (the last one when names repeat)
+        self.slotfields = list(self.fieldmap.values())
+        # the fields whose values can be modified in place
+        self.nested = [f for f in self.slotfields if f.is_struct or f.is_array]
+        self.build_steps()
+        # the steps whose written size depends on the values (arrays and structs)
+        self.varsteps = [step for step in self.steps if step.kind != STEP_RUN]
+
+    def build_steps(self):
+        run = []
+        for field in self.fields:
+            if not field.is_struct and not field.is_array:
+                run.append(field)
+                continue
+
+            if run:
+                self.steps.append(CodecStep(STEP_RUN, run))
+                run = []
+
+            if field.is_array and field.count == 0:
+                kind = STEP_OPENARRAY
+            elif field.is_struct:
+                kind = STEP_STRUCTARRAY if field.is_array else STEP_STRUCT
+            else:
+                kind = STEP_ARRAY
+
+            self.steps.append(CodecStep(kind, [field]))
+
+        if run:
+            self.steps.append(CodecStep(STEP_RUN, run))
+
+    def __repr__(self):
+        return f'StructCodec({self.name}, size={self.size:#x}, steps={len(self.steps)})'
@@ -1,6 +1,7 @@
 from functools import cache
 
-from utils import pd_utils as pdu
+from data import binutils as bnu
+import data.structcodec as stc
 
 
 class TypeInfo:
@@ -30,12 +31,18 @@ class TypeInfo:
         cls.sizeof.cache_clear()
         cls.offsetof.cache_clear()
         cls._struct_size.cache_clear()
+        cls.codec.cache_clear()
 
     @classmethod
     def register(cls, name, declaration, add_padding=True, varmap=None):
+        """
+        registers a declaration under 'name' and returns the name it was registered with.
+        Declarations with variables are registered as a variant of 'name', keyed by the
+        variable bindings, example: register('portalvertices', decl, varmap={'N': 7})
+        registers and returns 'portalvertices[N=7]'. Each variant is cached separately,
+        so registering variable-length records doesn't flush the caches of other types.
+        """
         if varmap:
-            cls.clear_cache()
-
             # replace variables in the declaration. Example: 'u8 val[N]' -> 'u8 val[5]'
             # where _vars = {'N': 5}
             decl = declaration.copy()
@@ -43,16 +50,26 @@ class TypeInfo:
             pairs = [(idx, key) for idx in range(n) for key in varmap.keys()]
             for (idx, key) in pairs: decl[idx] = decl[idx].replace(key, str(varmap[key]))
 
-            cls.decl_map[name] = decl
-            return
+            variant = variant_name(name, varmap)
+            if variant in cls.decl_map and cls.decl_map[variant] != decl:
+                cls.clear_cache()
+
+            cls.decl_map[variant] = decl
+            return variant
 
         if add_padding:
             declaration = cls.add_padding(declaration)
 
+        # registering a different declaration under an existing name invalidates the compiled codecs
+        if name in cls.decl_map and cls.decl_map[name] != declaration:
+            cls.codec.cache_clear()
+
         cls.decl_map[name] = declaration
         if name not in cls.sizes:
             cls.sizes[name], _ = cls._struct_size(name)
 
+        return name
+
     @classmethod
     def add_padding(cls, decl):
         # log = True
@@ -83,7 +100,7 @@ class TypeInfo:
             max_sz = max(max_sz, type_sz)
 
             # add pads if needed
-            pad_sz = pdu.align(cur_offset, type_sz) - cur_offset
+            pad_sz = bnu.align(cur_offset, type_sz) - cur_offset
             if type_sz > 1 and pad_sz > 0:
                 new_decl.append(f'u8 __pad{pad_n}__[{pad_sz}]')
                 if log: print(f'/*{cur_offset:02x}*/ u8 __pad__[{pad_sz}]')
@@ -141,6 +158,11 @@ class TypeInfo:
 
         return cls.sizes[typename]
 
+    @classmethod
+    @cache
+    def codec(cls, name):
+        return stc.StructCodec(name, cls.get_decl(name))
+
     @classmethod
     def get_decl(cls, typename):
         if typename not in cls.decl_map:
@@ -170,6 +192,11 @@ class TypeInfo:
         return ofs
 
 
+# name of the variant of a declaration, example: ('portalvertices', {'N': 7}) -> 'portalvertices[N=7]'
+def variant_name(name, varmap):
+    bindings = ','.join(f'{key}={varmap[key]}' for key in sorted(varmap.keys()))
+    return f'{name}[{bindings}]'
+
 def field_info(decl):
     """
     supported types are primitives, structs, arrays and pointers:
@@ -1,7 +1,12 @@
 import hashlib
+import json
+import os
 import shutil
 import time
 import os.path as osp
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 import bpy
 from bpy.types import PointerProperty, Panel
@@ -14,7 +19,10 @@ from materials.mat_othermode_l import *
 from materials.mat_tex import *
 
 from pd_data.gbi import *
-from pd_data import texload as texld
+from pd_data import texencode as texenc
+from pd_data import texdups
+from data import binutils as bnu
+from data import img_utils as imu
 from utils import pd_utils as pdu
 
 from fast64 import f3d
@@ -908,36 +916,171 @@ def textures_list(coll):
 
     return texlist
 
-def assign_texture_ids(start_id, coll):
+# with merge, the duplicated images get the ID of the image they duplicate instead of a new one.
+# The duplicates are only searched in coll, so the images they are merged into get their ID here
+def assign_texture_ids(start_id, coll, merge=False):
     texlist = pdm.textures_list(coll)
+    imglib = bpy.data.images
+    dups = texture_duplicates([coll]) if merge else {}
+
     custom_ids = set()
+    for imgname in texlist:
+        pd_image = imglib[imgname].pd_image
+        if not pd_image.custom_id: continue
+
+        if pd_image.id < 0:
+            print(f'WARNING: Image with invalid custom ID: {imgname}')
+            continue
+
+        custom_ids.add(pd_image.id)
 
     id = start_id
     for imgname in texlist:
-        pd_image = bpy.data.images[imgname].pd_image
+        pd_image = imglib[imgname].pd_image
+        if pd_image.custom_id or imgname in dups: continue
 
-        if pd_image.custom_id:
-            if pd_image.id < 0:
-                print(f'WARNING: Image with invalid custom ID: {imgname}')
-                continue
+        while id in custom_ids: id += 1
 
-            custom_ids.add(pd_image.id)
-        else:
-            while id in custom_ids: id += 1
+        pd_image.id = id
+        pd_image.id_ui = hex(id)
 
-            pd_image.id = id
-            pd_image.id_ui = hex(id)
-            
-            id += 1
+        id += 1
+
+    merge_texture_ids(dups)
+    check_texture_ids(coll, dups)
 
 def validate_texture_ids(coll):
     texlist = pdm.textures_list(coll)
     imglib = bpy.data.images
     return all([imglib[tex].pd_image.id >= 0 for tex in texlist])
 
-def export_textures(path, coll, flip=True):
+# the collections searched for duplicated textures, the images are kept in this order
+TEX_DUP_COLLECTIONS = ['Rooms', 'Models', 'Props']
+
+# finds the duplicated images used by the level, see texdups. The images with a custom ID
+# are left out. Returns {image name: name of the image it duplicates}
+def texture_duplicates(colls=TEX_DUP_COLLECTIONS):
+    imglib = bpy.data.images
+
+    images = {}
+    for coll in colls:
+        for name in textures_list(coll):
+            img = imglib[name]
+            if name in images or img.pd_image.custom_id: continue
+
+            # the format of the imported textures, images of different formats aren't merged
+            texinfo = img.get('texinfo')
+            kind = texinfo.get('format') if texinfo else None
+
+            images[name] = (image_rgba32(img), img.size[0], img.size[1], kind)
+
+    return texdups.tex_find_duplicates(images)
+
+# gives the duplicated images the ID of the image they duplicate, returns the previous
+# IDs of the images merged ({name: id}), see restore_texture_ids
+def merge_texture_ids(dups):
+    imglib = bpy.data.images
+
+    previous = {}
+    for name, dupname in dups.items():
+        id = imglib[dupname].pd_image.id
+        if id < 0: continue
+
+        pd_image = imglib[name].pd_image
+        previous[name] = pd_image.id
+        pd_image.id = id
+        pd_image.id_ui = hex(id)
+
+    return previous
+
+def restore_texture_ids(ids):
+    imglib = bpy.data.images
+    for name, id in ids.items():
+        pd_image = imglib[name].pd_image
+        pd_image.id = id
+        pd_image.id_ui = hex(id)
+
+# raises if images with different pixels share an ID, the merged duplicates (dups) excepted
+def check_texture_ids(coll, dups):
+    imglib = bpy.data.images
+
+    ids = {}
+    for name in textures_list(coll):
+        id = imglib[name].pd_image.id
+        if id >= 0:
+            ids.setdefault(id, []).append(name)
+
+    for id, names in ids.items():
+        kept = {dups.get(name, name) for name in names}
+        if len(kept) < 2: continue
+
+        hashes = {texdups.tex_exact_hash(image_rgba32(imglib[name]), *imglib[name].size) for name in kept}
+        if len(hashes) > 1:
+            raise Exception(f'Texture ID {id:04x} shared by different images: {", ".join(sorted(names))}')
+
+def print_texture_duplicates(dups):
+    imglib = bpy.data.images
+    for name, dupname in dups.items():
+        print(f'{name} ({imglib[name].pd_image.id:04x}) -> {dupname} ({imglib[dupname].pd_image.id:04x})')
+
+    print(f'{len(dups)} duplicated textures')
+
+# the pixels of the image as an RGBA (w*h, 4) uint8 array. The rows are bottom-up,
+# the order of the decoded textures
+def image_rgba32(img):
+    w, h = img.size
+    pixels = np.empty(w * h * img.channels, dtype=np.float32)
+    img.pixels.foreach_get(pixels)
+
+    buf = np.rint(np.clip(pixels, 0, 1) * 255).astype(np.uint8)
+    return imu.rgba32(buf, w, h, img.channels)
+
+# the manifest of the last texture export, in the export folder: {filename: hash}
+TEX_EXPORT_MANIFEST = 'pd_textures.json'
+
+def load_export_manifest(path):
+    try:
+        with open(osp.join(path, TEX_EXPORT_MANIFEST), 'r') as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+def save_export_manifest(path, manifest):
+    with open(osp.join(path, TEX_EXPORT_MANIFEST), 'w') as fd:
+        json.dump(manifest, fd, indent=1, sort_keys=True)
+
+# the hash of the exported content: the pixels and what they're converted with
+def export_hash(rgba, w, h, mode):
+    sha = hashlib.sha1(f'{mode} {w}x{h}'.encode())
+    sha.update(rgba.tobytes())
+    return sha.hexdigest()
+
+# encodes and writes a texture, runs in the export thread pool (no bpy access).
+# Returns the data size, None if the file is up to date
+# returns the size of the data written (None if the file is unchanged) and the texinfo
+# of the native encoding (None for PNGs)
+def export_texture(filepath, rgba, w, h, flip, native, texhash, manifest):
+    filename = osp.basename(filepath)
+    if manifest.get(filename) == texhash and osp.exists(filepath):
+        return None, None
+
+    texinfo = None
+    if native:
+        # the pixels are already in the game's row order, flip doesn't apply
+        data, texinfo = texenc.tex_encode(rgba, w, h)
+    else:
+        # the PNG rows are written bottom-up, like Image.save does
+        rows = rgba.reshape(h, w * 4)
+        data = imu.png_rgba32((rows[::-1] if flip else rows).tobytes(), w, h)
+
+    bnu.write_file(filepath, data, log=False)
+    return len(data), texinfo
+
+def export_textures(path, coll, flip=True, native=False, workers=None):
     '''
-    # Saves the texture images to the export folder, naming them according to the ID
+    # Saves the texture images to the export folder, naming them according to the ID.
+    # With native, the images are encoded to the game's texture formats instead (.bin files).
+    # The textures unchanged since the last export (see TEX_EXPORT_MANIFEST) aren't written again
     '''
 
     t0 = time.time()
@@ -945,32 +1088,56 @@ def export_textures(path, coll, flip=True):
     imglib = bpy.data.images
 
     n = len(texlist)
-    num_exp = 0
-
-    for name in texlist:
-        img = imglib[name]
-        pd_image = imglib[name].pd_image
-        id = pd_image.id
+    manifest = load_export_manifest(path)
+    mode = f'native {texenc.TEX_ENCODE_PSNR}' if native else f'png {flip}'
+    ext = 'bin' if native else 'png'
+
+    # the pixels are read here, bpy can only be used from the main thread
+    futures = []
+    exported_ids = set()
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for name in texlist:
+            img = imglib[name]
+            id = img.pd_image.id
+            w, h = img.size
+
+            # merged duplicates share their ID, the first image is exported
+            if id in exported_ids:
+                n -= 1
+                continue
 
-        imgcopy = img.copy()
-        imgcopy.update() # to update the copy's buffer content
+            exported_ids.add(id)
 
-        filename = osp.basename(img.filepath)
-        ext = filename.split('.')[-1]
-        srcpath = bpy.path.abspath(imgcopy.filepath)
+            rgba = image_rgba32(img)
+            texhash = export_hash(rgba, w, h, mode)
+            filepath = f'{path}/{id:04x}.{ext}'
 
-        print(f'{num_exp+1:03d}/{n} {img.name} {id:04x}')
+            future = executor.submit(export_texture, filepath, rgba, w, h, flip, native, texhash, manifest)
+            futures.append((img.name, id, filepath, texhash, future))
 
-        if flip:
-            texld.flip(imgcopy)
+    num_exp = 0
+    num_lowquality = 0
+    for idx, (name, id, filepath, texhash, future) in enumerate(futures):
+        size, texinfo = future.result()
+        status = 'unchanged' if size is None else f'{size} bytes'
+        print(f'{idx+1:03d}/{n} {name} {id:04x} {status}')
+        num_exp += size is not None
+
+        # left out of the manifest, so the warning is given again on the next export
+        if texinfo and not texinfo['psnr_ok']:
+            print(f'WARNING: {name} {id:04x} encoded with a PSNR of {texinfo["psnr"]:.1f} dB, '
+                  f'under {texenc.TEX_ENCODE_PSNR} dB')
+            num_lowquality += 1
+            continue
 
-        imgcopy.save(filepath=f'{path}/{id:04x}.{ext}')
-        bpy.data.images.remove(imgcopy)
+        manifest[osp.basename(filepath)] = texhash
 
-        num_exp += 1
+    save_export_manifest(path, manifest)
 
     fliptxt = 'yes' if flip else 'no'
-    print(f'{num_exp} textures exported to {path}. Flip: {fliptxt}')
+    print(f'{num_exp} textures exported to {path} ({n - num_exp} unchanged). Flip: {fliptxt}')
+    if num_lowquality:
+        print(f'WARNING: {num_lowquality} textures under the encoding PSNR threshold')
     print(f'Time: {time.time() - t0:.1f}s')
 
 
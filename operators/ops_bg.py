@@ -10,6 +10,7 @@ from bpy.props import IntProperty, StringProperty, BoolProperty, EnumProperty, F
 
 from utils import bg_utils as bgu
 from pd_data.pd_padsfile import *
+from utils import pd_utils as pdu
 import pd_blendprops as pdprops
 import materials.pd_materials as pdm
 
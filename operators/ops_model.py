@@ -4,7 +4,7 @@ import traceback
 import bpy
 from bpy.types import Operator
 from bpy_extras.io_utils import ImportHelper, ExportHelper
-from bpy.props import IntProperty, StringProperty
+from bpy.props import IntProperty, StringProperty, EnumProperty
 
 from pd_blendtools import pd_addonprefs as pda
 from ui.mtxpalette_panel import gen_icons
@@ -26,7 +26,7 @@ from fast64.f3d import f3d_material as f3dm
 
 def load_model(_context, modelname=None, filename=None):
     rompath = pda.rompath()
-    romdata = rom.Romdata(rompath)
+    romdata = rom.load(rompath)
 
     matlib = bpy.data.materials
     matcache = { mat.hashed:mat.name for mat in matlib }
@@ -180,6 +180,9 @@ class PDTOOLS_OT_ExportModel(Operator, ExportHelper):
 
     filename_ext = ''
 
+    compress_profile: EnumProperty(name='Compression', items=pdprops.ENUM_COMPRESS_PROFILES,
+                                   default=pdu.COMPRESS_DEFAULT, description="Compression Profile")
+
     @classmethod
     def description(cls, context, properties):
         scn = context.scene
@@ -197,7 +200,7 @@ class PDTOOLS_OT_ExportModel(Operator, ExportHelper):
         print(f'Export model: {self.filepath}')
         model_obj = get_model_obj(context.object)
         try:
-            mde.export_model(model_obj, self.filepath)
+            mde.export_model(model_obj, self.filepath, self.compress_profile)
         except RuntimeError as ex:
             traceback.print_exc()
             pass
@@ -11,8 +11,10 @@ from bpy.props import StringProperty, BoolProperty, IntProperty, CollectionPrope
 from pd_data.model_info import ModelNames, ModelStates
 from pd_blendprops import LEVELNAMES
 from pd_data.pd_padsfile import *
-from pd_data import romdata as rom
+from utils import pd_utils as pdu
+from pd_data import romdata as rom, texload as tex
 from pd_import import (
+    model_import as mdi,
     bg_import as bgi,
     tiles_import as tlimp,
     setup_import as stpi,
@@ -57,11 +59,14 @@ class PDTOOLS_OT_LoadRom(Operator, ImportHelper):
     def load_rom(context, filepath):
         scn = context.scene
 
-        romdata = rom.Romdata(filepath)
+        romdata = rom.load(filepath)
 
         # save into the addon settings
         pda.set_rompath(filepath)
 
+        # the textures extracted so far may come from another rom
+        mdi.extracted_textures.clear()
+
         # fill the scene's list of models
         scn.pd_modelfiles.clear()
         scn.pd_modelnames.clear()
@@ -70,42 +75,40 @@ class PDTOOLS_OT_LoadRom(Operator, ImportHelper):
         pdprops.rom_setups.clear()
         pdprops.rom_tiles.clear()
 
-        bg_idx = 0
-        modelfiles = []
-        for filename in romdata.fileoffsets.keys():
-            if filename.startswith('bgdata') or filename.startswith('ob'):
-                if filename.endswith('.seg'):
-                    lvcode = pdu.get_lvcode(filename)
-                    bgname = f'bg_{lvcode}'
-                    lvname = pdu.get_lvname(lvcode, LEVELNAMES)
-                    fullname = f'{lvname} ({bgname})' if lvname else bgname
-                    idx = f'{bg_idx:02X}: '
-                    pdprops.rom_bgs.append((bgname, idx+fullname, bgname))
-                    bg_idx += 1
-                elif 'pads' in filename:
-                    filename = filename.replace('bgdata/', '')
-                    lvcode = pdu.get_lvcode(filename)
-                    lvname = pdu.get_lvname(lvcode, LEVELNAMES)
-                    fullname = f'{lvname} ({filename})' if lvname else filename
-                    pdprops.rom_pads.append((filename, fullname, filename))
-                elif 'tiles' in filename:
-                    filename = filename.replace('bgdata/', '')
-                    lvcode = pdu.get_lvcode(filename)
-                    lvname = pdu.get_lvname(lvcode, LEVELNAMES)
-                    fullname = f'{lvname} ({filename})' if lvname else filename
-                    pdprops.rom_tiles.append((filename, fullname, filename))
-            elif filename[0] == 'U':
-                lvcode = pdu.get_lvcode(filename)
-                bgname = f'bg_{lvcode}'
-                mp = ' MP ' if filename.startswith('Ump_') else ' '
-                cs = ' CS' if bgname in LEVELNAMES and LEVELNAMES[bgname][2] else ''
-                lvname = pdu.get_lvname(lvcode, LEVELNAMES, False)
-                fullname = f'{lvname}{cs}{mp}({filename})' if lvname else filename
-                pdprops.rom_setups.append((filename, fullname, bgname))
-            elif filename[0] in ['P', 'C', 'G']:
-                modelfiles.append(filename)
-                # if item.alias: # TODO
-
+        assets = romdata.assets
+
+        for bg_idx, filename in enumerate(assets['bgs']):
+            lvcode = pdu.get_lvcode(filename)
+            bgname = f'bg_{lvcode}'
+            lvname = pdu.get_lvname(lvcode, LEVELNAMES)
+            fullname = f'{lvname} ({bgname})' if lvname else bgname
+            idx = f'{bg_idx:02X}: '
+            pdprops.rom_bgs.append((bgname, idx+fullname, bgname))
+
+        for filename in assets['pads']:
+            filename = filename.replace('bgdata/', '')
+            lvcode = pdu.get_lvcode(filename)
+            lvname = pdu.get_lvname(lvcode, LEVELNAMES)
+            fullname = f'{lvname} ({filename})' if lvname else filename
+            pdprops.rom_pads.append((filename, fullname, filename))
+
+        for filename in assets['tiles']:
+            filename = filename.replace('bgdata/', '')
+            lvcode = pdu.get_lvcode(filename)
+            lvname = pdu.get_lvname(lvcode, LEVELNAMES)
+            fullname = f'{lvname} ({filename})' if lvname else filename
+            pdprops.rom_tiles.append((filename, fullname, filename))
+
+        for filename in assets['setups']:
+            lvcode = pdu.get_lvcode(filename)
+            bgname = f'bg_{lvcode}'
+            mp = ' MP ' if filename.startswith('Ump_') else ' '
+            cs = ' CS' if bgname in LEVELNAMES and LEVELNAMES[bgname][2] else ''
+            lvname = pdu.get_lvname(lvcode, LEVELNAMES, False)
+            fullname = f'{lvname}{cs}{mp}({filename})' if lvname else filename
+            pdprops.rom_setups.append((filename, fullname, bgname))
+
+        modelfiles = list(assets['models'])
         modelfiles.sort()
         for filename in modelfiles:
             item = scn.pd_modelfiles.add()
@@ -431,8 +434,27 @@ class PDTOOLS_OT_TexAssignIDs(Operator):
 
         start_id = scn.tex_export_startid
         coll = context.scene.tex_export_collection
-        pdm.assign_texture_ids(start_id, coll)
+        pdm.assign_texture_ids(start_id, coll, scn.tex_export_merge)
+
+        return {'FINISHED'}
+
+
+class PDTOOLS_OT_ExtractTextures(Operator):
+    bl_idname = "pdtools.extract_textures"
+    bl_label = "Extract ROM Textures"
+    bl_description = "Decode all the ROM textures in parallel, so imports don't have to"
 
+    def execute(self, context):
+        romdata = rom.load(pda.rompath())
+
+        t = time.time()
+        tex_path = pdu.tex_path()
+        infos = tex.tex_extract_all(romdata, tex_path)
+        mdi.extracted_textures.update(infos)
+        mdi.cache_textures(romdata, tex_path, infos)
+
+        ntex = len(romdata.texoffsets)
+        self.report({'INFO'}, f'{len(infos)}/{ntex} textures extracted ({time.time() - t:.1f}s)')
         return {'FINISHED'}
 
 
@@ -464,9 +486,10 @@ class PDTOOLS_OT_TexManage(Operator):
         path = scn.tex_export_dir
         coll = scn.tex_export_collection
         flip = scn.tex_export_flip
+        native = scn.tex_export_native
 
-        pdm.assign_texture_ids(start_id, coll)
-        pdm.export_textures(path, coll, flip)
+        pdm.assign_texture_ids(start_id, coll, scn.tex_export_merge)
+        pdm.export_textures(path, coll, flip, native)
 
         return {"FINISHED"}
 
@@ -513,8 +536,17 @@ class PDTOOLS_OT_TexManage(Operator):
         row.label(text='')
         op = row.operator('pdtools.tex_print_ids', text='Print IDs')
         row = self.layout.row().split(factor=f)
+        row.label(text='')
+        op = row.operator('pdtools.tex_find_duplicates', text='Find Duplicates')
+        row = self.layout.row().split(factor=f)
+        row.label(text='Merge:')
+        row.prop(scn, 'tex_export_merge', text='Merge Duplicate Textures')
+        row = self.layout.row().split(factor=f)
         row.label(text='Flip:')
         row.prop(scn, 'tex_export_flip', text='')
+        row = self.layout.row().split(factor=f)
+        row.label(text='Encode:')
+        row.prop(scn, 'tex_export_native', text='')
 
 
 class PDTOOLS_OT_TexPrintIDs(Operator):
@@ -533,6 +565,20 @@ class PDTOOLS_OT_TexPrintIDs(Operator):
         return {'FINISHED'}
 
 
+class PDTOOLS_OT_TexFindDuplicates(Operator):
+    bl_idname = "pdtools.tex_find_duplicates"
+    bl_label = "Find Duplicate Textures"
+    bl_description = "Print The Duplicated Textures Of The Source Collection To Console"
+
+    def execute(self, context):
+        # the same images the IDs are merged between, see pdm.assign_texture_ids
+        dups = pdm.texture_duplicates([context.scene.tex_export_collection])
+        pdm.print_texture_duplicates(dups)
+        self.report({'INFO'}, f'{len(dups)} duplicated textures')
+
+        return {'FINISHED'}
+
+
 class StringItem(PropertyGroup):
     value: StringProperty(name='value')
 
@@ -712,7 +758,7 @@ class PDTOOLS_OT_ExportLevel(Operator):
         dir = scene.export_dir
         sep = os.sep if dir[-1] != os.sep else ''
         filepath = f'{dir}{sep}{filename}'
-        module.export(filepath, scene.export_compress)
+        module.export(filepath, scene.export_compress, scene.export_compress_profile)
 
     def execute(self, context):
         scn = context.scene
@@ -725,7 +771,19 @@ class PDTOOLS_OT_ExportLevel(Operator):
                 self.report({'ERROR'}, 'Invalid Texture Start ID')
                 return {'CANCELLED'}
 
-            self.export(scn, bge, scn.export_file_bg)
+            # only the level textures are merged, the models and props keep their IDs.
+            # The merged IDs are only used by this export, the images get theirs back after
+            dups = {}
+            if scn.export_merge_textures:
+                dups = pdm.texture_duplicates(['Rooms'])
+                pdm.print_texture_duplicates(dups)
+
+            merged = pdm.merge_texture_ids(dups)
+            try:
+                if dups: pdm.check_texture_ids('Rooms', dups)
+                self.export(scn, bge, scn.export_file_bg)
+            finally:
+                pdm.restore_texture_ids(merged)
 
         if scn.export_pads:
             self.export(scn, pde, scn.export_file_pads)
@@ -758,6 +816,12 @@ class PDTOOLS_OT_ExportLevel(Operator):
         row.prop(scn, 'export_compress', text='Compress Files')
         row.prop(scn, 'export_multiplayer', text='Multiplayer')
 
+        row = self.layout.row()
+        row.prop(scn, 'export_compress_profile', text='Compression')
+
+        row = self.layout.row()
+        row.prop(scn, 'export_merge_textures', text='Merge Duplicate Textures')
+
     def draw_file(self, context, prop_name, prop_text, enabled):
         scn = context.scene
 
@@ -843,7 +907,9 @@ classes = [
     PDTOOLS_OT_ExportLevel,
     PDTOOLS_OT_TexPrintIDs,
     PDTOOLS_OT_TexAssignIDs,
+    PDTOOLS_OT_TexFindDuplicates,
     PDTOOLS_OT_TexManage,
+    PDTOOLS_OT_ExtractTextures,
     StringItem,
     PDTOOLS_UL_BasicList,
     PDTOOLS_OT_Replacements,
@@ -21,6 +21,13 @@ class PD_AddonPreferences(bpy.types.AddonPreferences):
 
     log_level: bpy.props.EnumProperty(name='log_level', items=ENUM_LOG_LEVEL, default='error')
 
+    texcache_size: bpy.props.IntProperty(
+        name="Texture Cache Size (MB)",
+        description="Maximum size of the decoded textures cache, the least recently used are removed first",
+        default=256,
+        min=0,
+    )
+
 
     # ######### ADDON UPDATER #########
     auto_check_update = bpy.props.BoolProperty(
@@ -69,6 +76,9 @@ class PD_AddonPreferences(bpy.types.AddonPreferences):
         row = row.row()
         row.prop(self, 'log_level', text='Log Level', expand=True)
 
+        row = self.layout.row()
+        row.prop(self, 'texcache_size')
+
         addon_updater_ops.update_settings_ui(self, context)
         addon_updater_ops.update_notice_box_ui(self, context)
 
@@ -98,3 +108,8 @@ def log_level():
 
     return prefs.log_level
 
+def texcache_size():
+    prefs = addon_prefs()
+    if not prefs: return 0
+
+    return prefs.texcache_size
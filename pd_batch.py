@@ -0,0 +1,180 @@
+"""
+Batch processing of the assets of a ROM, without Blender.
+
+    python pd_batch.py <rom> extract   -o <outdir> [-a models bgs textures ...] [-j workers]
+    python pd_batch.py <rom> validate  [-a ...] [-j workers]
+    python pd_batch.py <rom> roundtrip [-a models] [-j workers]
+    python pd_batch.py <rom> info      [-a models bgs] [-j workers]
+
+extract:   writes the (decompressed) asset files and the textures as PNGs to outdir
+validate:  parses every asset, reporting the ones that fail
+roundtrip: parses every model and writes it back, checking that reading and writing
+           the result again produces the same data
+info:      prints the header of every model and the number of rooms of every bg, only
+           the start of the files is inflated
+"""
+import argparse
+import fnmatch
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from data.typeinfo import TypeInfo
+from data import binutils as bnu
+from pd_data import romdata as rom, texload as tex
+from pd_data.pd_model import PD_ModelFile, read_modeldef
+from pd_data.pd_bgfile import PD_BGFile, bg_numrooms
+from pd_data.pd_bgtiles import PD_TilesFile
+from pd_data.pd_padsfile import PD_PadsFile
+from pd_data.pd_setupfile import PD_SetupFile
+from pd_data.decl_model import model_decls
+from pd_data.decl_bgfile import bgfile_decls
+from pd_data.decl_bgtiles import bgtiles_decl
+from pd_data.decl_setupfile import setupfile_decls
+from pd_data.decl_padsfile import padsfile_decls
+
+ASSET_TYPES = ['models', 'bgs', 'tiles', 'pads', 'setups', 'textures']
+
+Parsers = {
+    'models': PD_ModelFile,
+    'bgs':    PD_BGFile,
+    'tiles':  PD_TilesFile,
+    'pads':   PD_PadsFile,
+    'setups': PD_SetupFile,
+}
+
+# the rom loaded by each worker process
+_romdata = None
+
+def register_decls():
+    for decls in [model_decls, bgfile_decls, bgtiles_decl, setupfile_decls, padsfile_decls]:
+        TypeInfo.register_all(decls)
+
+def init_worker(rompath):
+    global _romdata
+    register_decls()
+    _romdata = rom.load(rompath)
+
+def rom_assets(romdata):
+    assets = {assettype: sorted(names) for assettype, names in romdata.assets.items()}
+    assets['textures'] = sorted(romdata.texoffsets.keys())
+    return assets
+
+def texname(texnum):
+    return f'{texnum:04x}.png'
+
+def write_output(outdir, filename, data):
+    path = os.path.join(outdir, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    bnu.write_file(path, data, log=False)
+
+def extract(assettype, name, outdir):
+    if assettype == 'textures':
+        texdir = os.path.join(outdir, 'textures')
+        os.makedirs(texdir, exist_ok=True)
+        tex.tex_load(_romdata.texturedata(name), texdir, texname(name))
+    else:
+        write_output(os.path.join(outdir, 'files'), name, _romdata.filedata(name))
+
+def validate(assettype, name, _outdir):
+    if assettype == 'textures':
+        # decode only, the image isn't written
+        tex.tex_decode(_romdata.texturedata(name))
+    else:
+        parsed = Parsers[assettype](_romdata.filedata(name))
+        # the bg rooms are only read on access
+        if assettype == 'bgs':
+            parsed.read_gfxdata()
+
+def roundtrip(assettype, name, _outdir):
+    if assettype != 'models':
+        raise Exception(f'round trip not supported for {assettype}')
+
+    data = bytes(PD_ModelFile(_romdata.filedata(name)).write())
+    data2 = bytes(PD_ModelFile(data).write())
+
+    if data != data2:
+        ofs = next(i for i, (a, b) in enumerate(zip(data, data2)) if a != b) if len(data) == len(data2) else -1
+        raise Exception(f'output differs (size {len(data):X}/{len(data2):X}, first diff at {ofs:X})')
+
+def info(assettype, name, _outdir):
+    if assettype == 'models':
+        modeldef = read_modeldef(_romdata, name)
+        return (f"{modeldef['numparts']} parts, {modeldef['nummatrices']} matrices, "
+                f"{modeldef['numtexconfigs']} texconfigs")
+    elif assettype == 'bgs':
+        return f'{bg_numrooms(_romdata.filedata(name))} rooms'
+
+    raise Exception(f'info not supported for {assettype}')
+
+Commands = {
+    'extract':   extract,
+    'validate':  validate,
+    'roundtrip': roundtrip,
+    'info':      info,
+}
+
+# the asset types processed when none is given, all of them for the other commands
+DefaultAssets = {
+    'roundtrip': ['models'],
+    'info':      ['models', 'bgs'],
+}
+
+def run_task(command, assettype, name, outdir):
+    t = time.time()
+    try:
+        result = Commands[command](assettype, name, outdir)
+        return assettype, name, None, time.time() - t, result
+    except Exception:
+        return assettype, name, traceback.format_exc(limit=3), time.time() - t, None
+
+def asset_str(assettype, name):
+    return f'{assettype}/{texname(name)}' if assettype == 'textures' else f'{assettype}/{name}'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Extract, validate, round-trip and inspect Perfect Dark ROM assets')
+    parser.add_argument('rom', help='path to the ROM (ntsc-final)')
+    parser.add_argument('command', choices=Commands.keys())
+    parser.add_argument('-a', '--assets', nargs='+', choices=ASSET_TYPES, default=None,
+                        help='asset types to process (default: all, models for roundtrip, models and bgs for info)')
+    parser.add_argument('-m', '--match', default='*', help='only process the assets matching this pattern, ex: "models/Pc*"')
+    parser.add_argument('-o', '--outdir', default='pd_extract', help='output directory for extract')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print each processed asset')
+    args = parser.parse_args(argv)
+
+    assettypes = args.assets or DefaultAssets.get(args.command, ASSET_TYPES)
+
+    register_decls()
+    romdata = rom.load(args.rom)
+    assets = rom_assets(romdata)
+
+    tasks = []
+    for assettype in assettypes:
+        for name in assets[assettype]:
+            if fnmatch.fnmatch(asset_str(assettype, name), args.match):
+                tasks.append((args.command, assettype, name, args.outdir))
+
+    print(f'{args.command}: {len(tasks)} assets, {args.workers} workers')
+
+    t = time.time()
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.rom,)) as executor:
+        results = executor.map(run_task, *zip(*tasks), chunksize=8) if tasks else []
+        for assettype, name, error, duration, result in results:
+            if error:
+                failed.append((assettype, name))
+                print(f'FAILED {asset_str(assettype, name)}\n{error}')
+            elif result is not None:
+                print(f'{asset_str(assettype, name)}: {result}')
+            elif args.verbose:
+                print(f'ok {asset_str(assettype, name)} ({duration:.3f}s)')
+
+    print(f'done: {len(tasks) - len(failed)} ok, {len(failed)} failed ({time.time() - t:.2f}s)')
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
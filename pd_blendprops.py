@@ -1378,6 +1378,12 @@ def on_select_pdtype(self, context):
 class Fast64_Properties(bpy.types.PropertyGroup):
     renderSettings: bpy.props.PointerProperty(type=Fast64RenderSettings_Properties, name="Fast64 Render Settings")
 
+ENUM_COMPRESS_PROFILES = [
+    (pdu.COMPRESS_FAST, 'Fast', 'Fastest compression, bigger files (for iteration builds)', 0),
+    (pdu.COMPRESS_DEFAULT, 'Default', 'Default compression', 1),
+    (pdu.COMPRESS_MAX, 'Max', 'Slowest compression, smallest files (for final builds)', 2),
+]
+
 ENUM_LV_IMPORT_MAT = [
     ('simple', 'Simple', 'Simple Material, innacurate (in Blender) but fast to load', 0),
     ('f3d', 'F3D (Accurate)', 'F3D Material, more accurate (in Blender) but much slower to load', 1),
@@ -1578,6 +1584,10 @@ def register():
                                        options={"TEXTEDIT_UPDATE"}, subtype='FILE_NAME', update=on_update_exportname,
                                        get=lambda _: name_get('export_name'), set=lambda _, val: name_set(val, 'export_name'))
     Scene.export_compress = BoolProperty(name='export_compress', default=True, description="Compress Exported Files")
+    Scene.export_compress_profile = EnumProperty(name='export_compress_profile', items=ENUM_COMPRESS_PROFILES,
+                                                 default=pdu.COMPRESS_DEFAULT, description="Compression Profile")
+    Scene.export_merge_textures = BoolProperty(name='export_merge_textures', default=False,
+                                               description="Give Duplicated Textures A Single ID On BG Export")
     Scene.export_multiplayer = BoolProperty(name='export_multiplayer', default=True, description="Level is a Multiplayer arena",
                                             update=on_update_exportmultiplayer)
 
@@ -1594,6 +1604,9 @@ def register():
     Scene.tex_export_collection = EnumProperty(items=ITEMS_TEX_EXPORT_COLL, name="tex_export_collection", default="Rooms")
     Scene.tex_export_dir = StringProperty(name='tex_export_dir', description="Folder To Export Textures To", subtype='DIR_PATH')
     Scene.tex_export_flip = BoolProperty(name='tex_export_flip', default=True, description="Flip Textures On Export")
+    Scene.tex_export_merge = BoolProperty(name='tex_export_merge', default=False,
+                                          description="Give Duplicated Textures A Single ID When Assigning IDs")
+    Scene.tex_export_native = BoolProperty(name='tex_export_native', default=False, description="Encode Textures To The Game Formats On Export")
     Scene.tex_export_startid = IntProperty(name='tex_export_startid', default=3512, description="")
 
     # external textures
@@ -3,16 +3,42 @@ import time
 from data.bytestream import ByteStream
 from .decl_bgfile import *
 from data.typeinfo import TypeInfo
-from utils import pd_utils as pdu
+from data import binutils as bnu
 
 
 ROOMBLOCKTYPE_LEAF = 0
 ROOMBLOCKTYPE_PARENT = 1
 
 
+# the number of rooms of a BG file (PD_BGFile.numrooms). Only the start of the primary
+# data is inflated, up to the end of the room list
+def bg_numrooms(bgdata):
+    primcompsize = int.from_bytes(bgdata[8:12], 'big')
+    roomsize = TypeInfo.sizeof('bgroom')
+
+    data = bytearray()
+    start = None
+    n = 0
+    for chunk in bnu.decompress_iter(memoryview(bgdata)[0xc:0xc + primcompsize], chunksize=0x1000):
+        data += chunk
+
+        if start is None:
+            if len(data) < 8: continue
+            # the header points to the rooms, room 0 is skipped
+            start = int.from_bytes(data[4:8], 'big') - 0x0f000000 + roomsize
+
+        while start + (n + 1) * roomsize <= len(data):
+            ofs = start + n * roomsize
+            if int.from_bytes(data[ofs:ofs + 4], 'big') == 0:
+                return n
+            n += 1
+
+    raise Exception('bg_numrooms: end of the room list not found')
+
 class PD_BGFile:
     def __init__(self, bgdata):
-        self.bgdata = bgdata
+        # a view, so the sections are inflated from the data without copying it
+        self.bgdata = memoryview(bgdata)
         self.bs = ByteStream(bgdata)
 
         self.gfxdata = {}
@@ -34,7 +60,6 @@ class PD_BGFile:
         self.read_primarydata()
         self.read_section2()
         self.read_section3()
-        self.read_gfxdata()
 
     def load_filedata(self):
         bs = self.bs
@@ -46,7 +71,7 @@ class PD_BGFile:
 
         self.offsetgfxdata = primarydatasize - primcompsize - 0xc
 
-        self.primarydata = pdu.decompress(self.bgdata[0xc:0xc + primcompsize])
+        self.primarydata = bnu.decompress(self.bgdata[0xc:0xc + primcompsize])
 
         # load section 2
         section2start = section1compsize + 0xc
@@ -55,7 +80,7 @@ class PD_BGFile:
         section2compsize = bs.read_primitive('u16')
         section2end = section2start + section2compsize + 4
 
-        self.section2 = pdu.decompress(self.bgdata[section2start + 4:section2end])
+        self.section2 = bnu.decompress(self.bgdata[section2start + 4:section2end])
 
         self.numtextures = (section2inflatedsize & 0x7fff) >> 1
 
@@ -65,7 +90,7 @@ class PD_BGFile:
         section3inflatedsize = bs.read_primitive('u16')
         section3compsize = bs.read_primitive('u16')
         section3end = section3start + section3compsize + 4
-        self.section3 = pdu.decompress(self.bgdata[section3start + 4:section3end])
+        self.section3 = bnu.decompress(self.bgdata[section3start + 4:section3end])
 
     def read_primarydata(self):
         bs = self.bs
@@ -154,12 +179,12 @@ class PD_BGFile:
     def read_bgportalvertices(self):
         bs = self.bs
 
-        c = pdu.align(bs.cursor, 4)
+        c = bnu.align(bs.cursor, 4)
         bs.set_cursor(c)
         for n, portal in enumerate(self.portals):
             count = bs.peek('u8')
-            TypeInfo.register('portalvertices', decl_portalvertices, False, varmap={'N': count})
-            vtx = bs.read_block('portalvertices')
+            decl_name = TypeInfo.register('portalvertices', decl_portalvertices, False, varmap={'N': count})
+            vtx = bs.read_block(decl_name)
             self.portalvertices.append(vtx)
 
     def read_section2(self):
@@ -195,9 +220,17 @@ class PD_BGFile:
 
             totalights += numlights
 
+    # the rooms gfx data is only inflated and read on first access, with roomgfx
     def read_gfxdata(self):
         for r in range(1, self.numrooms):
-            self.load_roomgfxdata(r)
+            self.roomgfx(r)
+
+    # returns the room, its gfx data loaded ('gfxdata', 'roomblocks', 'vtx', 'colors', '_gdldata')
+    def roomgfx(self, roomnum):
+        if roomnum not in self.gfxdata:
+            self.load_roomgfxdata(roomnum)
+
+        return self.rooms[roomnum]
 
     def load_roomgfxdata(self, roomnum):
         start = self.rooms[roomnum]['id']
@@ -212,7 +245,7 @@ class PD_BGFile:
         start -= 0x0f000000
         start -= self.offsetgfxdata
 
-        self.gfxdata[roomnum] = pdu.decompress(self.bgdata[start:start + complen])
+        self.gfxdata[roomnum] = bnu.decompress(self.bgdata[start:start + complen])
         self.rooms[roomnum]['prevgfxdatalen'] = len(self.gfxdata)
         self.read_roomgfxdata(roomnum)
 
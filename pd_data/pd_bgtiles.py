@@ -9,7 +9,7 @@ warnings.filterwarnings("ignore", category=DeprecationWarning)
 class PD_TilesFile:
     def __init__(self, tilesdata):
         self.tilesdata = tilesdata
-        self.bs = ByteStream(tilesdata)
+        self.bs = ByteStream(tilesdata, zerocopy=True)
 
         self.tilerooms = []
         self.geos = []
@@ -38,11 +38,11 @@ class PD_TilesFile:
                 room += 1
 
             if geotype == GEOTYPE_TILE_I:
-                TypeInfo.register('geotilei', decl_geotilei, varmap={'N': numvtx})
-                geo = bs.read_block('geotilei')
+                decl_name = TypeInfo.register('geotilei', decl_geotilei, varmap={'N': numvtx})
+                geo = bs.read_block(decl_name)
             elif geotype == GEOTYPE_TILE_F:
-                TypeInfo.register('geotilef', decl_geotilei, varmap={'N': numvtx})
-                geo = bs.read_block('geotilef')
+                decl_name = TypeInfo.register('geotilef', decl_geotilei, varmap={'N': numvtx})
+                geo = bs.read_block(decl_name)
             elif geotype == GEOTYPE_BLOCK:
                 geo = bs.read_block('geoblock')
             elif geotype == GEOTYPE_CYL:
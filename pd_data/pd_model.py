@@ -3,7 +3,7 @@ from collections import namedtuple
 
 from data.bytestream import ByteStream
 from .decl_model import *
-from utils import pd_utils as pdu
+from data import binutils as bnu
 from data.typeinfo import TypeInfo
 
 NODETYPE_CHRINFO      = 0x01
@@ -222,10 +222,10 @@ class PD_ModelFile:
     def read_modelparts(self):
         bs = self.bs
         n = self.modeldef['numparts']
-        TypeInfo.register('parts', decl_parts, varmap={'N': n})
+        decl_name = TypeInfo.register('parts', decl_parts, varmap={'N': n})
         addr = unmask(self.modeldef['parts'])
         bs.set_cursor(addr)
-        self.modelparts = bs.read_block('parts')
+        self.modelparts = bs.read_block(decl_name)
 
     def read_rodata(self):
         bs = self.bs
@@ -257,9 +257,9 @@ class PD_ModelFile:
         if numvertices:
             vtxsize = 12
             start = rodata['vertices']
-            end = pdu.ALIGN8(unmask(start) + numvertices * vtxsize)
+            end = bnu.ALIGN8(unmask(start) + numvertices * vtxsize)
             self.vertices[idx] = bs.read_block_raw(unmask(start), end)
-            col_start = pdu.ALIGN8(unmask(end))
+            col_start = bnu.ALIGN8(unmask(end))
             col_end = rodata.addr
 
             # save colors at the same address as the vertices
@@ -345,14 +345,19 @@ class PD_ModelFile:
         for ro in self.rodatas:
             nodetype = ro['_node_type_']
             if nodetype == NODETYPE_BBOX:
-                coords = [pdu.f32(ro[e]) for e in ['xmin', 'xmax', 'ymin', 'ymax', 'zmin', 'zmax']]
+                coords = [bnu.f32(ro[e]) for e in ['xmin', 'xmax', 'ymin', 'ymax', 'zmin', 'zmax']]
                 bbox = Bbox(*coords)
                 return bbox
 
         return None
 
 
+# the modeldef (header) of a rom model, only the start of the file is inflated
+def read_modeldef(romdata, modelname):
+    modeldata = romdata.filedata(modelname, TypeInfo.sizeof('modeldef'))
+    return ByteStream(modeldata).read_block('modeldef')
+
 def read(path, filename, skipDLdata=False):
-    modeldata = pdu.read_file(f'{path}/{filename}')
-    modeldata = pdu.decompress(modeldata)
+    modeldata = bnu.read_file(f'{path}/{filename}')
+    modeldata = bnu.decompress(modeldata)
     return PD_ModelFile(modeldata, skipDLdata)
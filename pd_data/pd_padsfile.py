@@ -4,7 +4,7 @@ from functools import cache
 from data.bytestream import ByteStream
 from .decl_padsfile import *
 from data.typeinfo import TypeInfo
-from utils import pd_utils as pdu
+from data import binutils as bnu
 
 Vec3 = namedtuple('Vec3', 'x y z')
 Bbox = namedtuple('Bbox', 'xmin xmax ymin ymax zmin zmax')
@@ -32,7 +32,7 @@ class Pad_:
 class PD_PadsFile:
     def __init__(self, padsfiledata):
         self.padsfiledata = padsfiledata
-        self.bs = ByteStream(padsfiledata)
+        self.bs = ByteStream(padsfiledata, zerocopy=True)
 
         self.paddata = []
         self.padindices = [] # index of each pad into paddata
@@ -47,8 +47,8 @@ class PD_PadsFile:
 
         numpads = bs.peek('u32')
 
-        TypeInfo.register('padsfileheader', decl_padsfileheader, varmap={'N': numpads})
-        self.header = header = bs.read_block('padsfileheader')
+        decl_name = TypeInfo.register('padsfileheader', decl_padsfileheader, varmap={'N': numpads})
+        self.header = header = bs.read_block(decl_name)
 
         for i in range(0, numpads):
             ofs = header['padoffsets']
@@ -74,9 +74,8 @@ class PD_PadsFile:
 
             fields = fieldsmap[num] if num in fieldsmap else None
 
-            for i in range(0, num):
-                val = bs.read_primitive(typename)
-                self.paddata.append((typename, val))
+            values = bs.read_primitives(typename, num)
+            self.paddata += [(typename, val) for val in values]
 
         bs.set_cursor(offset)
         end = bs.cursor + size
@@ -198,10 +197,10 @@ class PD_PadsFile:
         idx = padidx + 1
         if flags & PADFLAG_INTPOS:
             if fields & PADFIELD_POS:
-                pos = Vec3(*[pdu.s16(self.paddata[i][1]) for i in range(idx, idx+3)])
+                pos = Vec3(*[bnu.s16(self.paddata[i][1]) for i in range(idx, idx+3)])
             idx += 4
         elif fields & PADFIELD_POS:
-            pos = Vec3(*[pdu.f32(self.paddata[i][1]) for i in range(idx, idx+3)])
+            pos = Vec3(*[bnu.f32(self.paddata[i][1]) for i in range(idx, idx+3)])
             idx += 3
 
         if flags & (PADFLAG_UPALIGNTOX | PADFLAG_UPALIGNTOY | PADFLAG_UPALIGNTOZ):
@@ -218,7 +217,7 @@ class PD_PadsFile:
                 up = Vec3(x, y, z)
         else:
             if fields & (PADFIELD_UP | PADFIELD_NORMAL):
-                up = Vec3(*[pdu.f32(self.paddata[i][1]) for i in range(idx, idx+3)])
+                up = Vec3(*[bnu.f32(self.paddata[i][1]) for i in range(idx, idx+3)])
             idx += 3
 
         if flags & (PADFLAG_LOOKALIGNTOX | PADFLAG_LOOKALIGNTOY | PADFLAG_LOOKALIGNTOZ):
@@ -235,7 +234,7 @@ class PD_PadsFile:
                 look = Vec3(x, y, z)
         else:
             if fields & (PADFIELD_LOOK | PADFIELD_NORMAL):
-                look = Vec3(*[pdu.f32(self.paddata[i][1]) for i in range(idx, idx+3)])
+                look = Vec3(*[bnu.f32(self.paddata[i][1]) for i in range(idx, idx+3)])
             idx += 3
 
         if fields & PADFIELD_NORMAL:
@@ -246,7 +245,7 @@ class PD_PadsFile:
 
         if flags & PADFLAG_HASBBOXDATA:
             if fields & PADFIELD_BBOX:
-                bbox = Bbox(*[pdu.f32(self.paddata[i][1]) for i in range(idx, idx+6)])
+                bbox = Bbox(*[bnu.f32(self.paddata[i][1]) for i in range(idx, idx+6)])
         elif fields & PADFIELD_BBOX:
             bbox = Bbox(-100, 100, -100, 100, 100, 100)
 
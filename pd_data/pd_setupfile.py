@@ -5,7 +5,7 @@ from data.typeinfo import TypeInfo
 
 class PD_SetupFile:
     def __init__(self, setupdata):
-        self.bs = ByteStream(setupdata)
+        self.bs = ByteStream(setupdata, lazy=True)
 
         self.props = []
         self.introcmds = []
@@ -62,8 +62,8 @@ class PD_SetupFile:
         s = bs.cursor
         while cmd != ENDMARKER_INTROCMD:
             numargs = cmd_size[cmd] - 1
-            TypeInfo.register('intro', decl_intro_cmd, varmap={'N': numargs})
-            intro = bs.read_block('intro')
+            decl_name = TypeInfo.register('intro', decl_intro_cmd, varmap={'N': numargs})
+            intro = bs.read_block(decl_name)
             self.introcmds.append(intro)
             cmd = bs.peek('s32')
             i += 1
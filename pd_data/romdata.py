@@ -1,30 +1,136 @@
-from functools import cache
+import os
+import json
+import mmap
+import hashlib
+from functools import cached_property
 
-from utils import pd_utils as pdu
-from pd_blendtools import pd_addonprefs as pdp
+from data import binutils as bnu
 
 
+# version of the rom index sidecar, bump it when its contents change
+ROM_INDEX_VERSION = 1
+
+# the rom is memory mapped: the file and texture data are views into it (memoryview), and
+# the data segment and the file and texture tables are only read when first used. The tables
+# are saved to a sidecar file next to the rom (see read_index), later loads read them from it
 class Romdata:
     def __init__(self, filename):
-        fd = open(filename, 'rb')
-        self.rom = fd.read()
-        fd.close()
+        with open(filename, 'rb') as fd:
+            self.mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
 
+        self.filename = filename
+        self.rom = memoryview(self.mm)
         self.romid = 'ntsc-final'
 
+    @cached_property
+    def data(self):
         dataofs = self.section_ofs('data')
-        self.data = pdu.decompress(self.rom[dataofs:])
-
-        self.fileoffsets = {}
-        self.filenames = []
-        self.texoffsets = {}
+        return bnu.decompress(self.rom[dataofs:])
+
+    # read_index sets these attributes, which replaces the properties
+    @cached_property
+    def fileoffsets(self):
+        self.read_index()
+        return self.fileoffsets
+
+    @cached_property
+    def filenames(self):
+        self.read_index()
+        return self.filenames
+
+    @cached_property
+    def texoffsets(self):
+        self.read_index()
+        return self.texoffsets
+
+    @cached_property
+    def assets(self):
+        self.read_index()
+        return self.assets
+
+    # identifies the rom file cheaply: the checksum in the rom header, the size and the modification time
+    @cached_property
+    def checksum(self):
+        mtime = os.stat(self.filename).st_mtime_ns
+        return f'{self.rom[0x10:0x18].hex()}-{len(self.rom):x}-{mtime:x}'
+
+    def index_path(self):
+        return f'{self.filename}.index.json'
+
+    # loads the file and texture tables from the sidecar, or reads them from the rom and saves them
+    def read_index(self):
+        if self.load_index(): return
 
         self.read_files()
         self.read_textures()
+        self.assets = self.read_assets()
+        self.save_index()
+
+    # returns False if there's no index or it's not the one of this rom
+    def load_index(self):
+        try:
+            with open(self.index_path(), 'r') as fd:
+                index = json.load(fd)
+        except (OSError, ValueError):
+            return False
+
+        if index.get('version') != ROM_INDEX_VERSION or index.get('checksum') != self.checksum:
+            return False
+
+        self.filenames = index['filenames']
+        self.fileoffsets = {name: (start, end) for name, start, end in index['files']}
+        self.texoffsets = {texnum: (start, end) for texnum, start, end in index['textures']}
+        self.assets = index['assets']
+        return True
+
+    def save_index(self):
+        index = {
+            'version': ROM_INDEX_VERSION,
+            'checksum': self.checksum,
+            'filenames': self.filenames,
+            'files': [[name, start, end] for name, (start, end) in self.fileoffsets.items()],
+            'textures': [[texnum, start, end] for texnum, (start, end) in self.texoffsets.items()],
+            'assets': self.assets,
+        }
+
+        # written to a temporary file first: other processes may be reading it
+        path = self.index_path()
+        tmppath = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmppath, 'w') as fd:
+                json.dump(index, fd)
+            os.replace(tmppath, path)
+        except OSError as e:
+            print(f'WARNING: unable to save the rom index {path}: {e}')
+
+    # the files of each type of asset, in rom order: {type: [filename]}
+    def read_assets(self):
+        assets = {assettype: [] for assettype in ['bgs', 'pads', 'tiles', 'setups', 'models']}
+
+        for filename in self.fileoffsets.keys():
+            if filename.startswith('bgdata') or filename.startswith('ob'):
+                if filename.endswith('.seg'):
+                    assets['bgs'].append(filename)
+                elif 'pads' in filename:
+                    assets['pads'].append(filename)
+                elif 'tiles' in filename:
+                    assets['tiles'].append(filename)
+            elif filename[0] == 'U':
+                assets['setups'].append(filename)
+            elif filename[0] in ['P', 'C', 'G']:
+                assets['models'].append(filename)
+
+        return assets
+
+    # identifies the rom contents, ex: to key the data extracted from it
+    @cached_property
+    def sha1(self):
+        return hashlib.sha1(self.rom).hexdigest()
 
     def read_files(self):
         offsets_list = self.get_file_offsets()
         self.filenames = self.get_file_names(offsets_list[-1])
+        self.fileoffsets = {}
 
         for (index, offset) in enumerate(offsets_list):
             if index == 0:
@@ -37,10 +143,16 @@ class Romdata:
             name = self.filenames[index]
             self.fileoffsets[name] = (offset, endoffset)
 
-    def filedata(self, filename):
+    # the data of the file, inflated if it's compressed. With size, only its first size
+    # bytes are returned (and inflated), ex: to read a header
+    def filedata(self, filename, size=None):
         ofs = self.fileoffsets[filename]
         data = self.rom[ofs[0]:ofs[1]]
-        return pdu.decompress(data) if data[0:2] == b'\x11\x73' else data
+
+        if data[0:2] != b'\x11\x73':
+            return data if size is None else data[:size]
+
+        return bnu.decompress(data) if size is None else bnu.decompress_head(data, size)
 
     def texturedata(self, texnum):
         ofs = self.texoffsets[texnum]
@@ -50,6 +162,7 @@ class Romdata:
         base = self.section_ofs('textures')
         datalen = 0x294960 if self.romid == 'jpn-final' else 0x291d60
         tablepos = base + datalen
+        self.texoffsets = {}
         index = 0
         while True:
             start = int.from_bytes(self.rom[tablepos+1:tablepos+4], 'big')
@@ -81,8 +194,8 @@ class Romdata:
             i += 4
 
     def read_name(self, address):
-        nullpos = self.rom[address:].index(0)
-        return str(self.rom[address:address + nullpos], 'utf-8')
+        nullpos = self.mm.find(b'\x00', address)
+        return str(self.rom[address:nullpos], 'utf-8')
 
     def section_ofs(self, section):
         romid = self.romid
@@ -98,9 +211,22 @@ section_offsets = {
     'textures':      [0x1d65f40, 0x1d5ca20, 0x1d61f90, ],
 }
 
-@cache
+# the rom loaded from each path: {path: ((mtime, size), Romdata)}
+_roms = {}
+
+# returns the Romdata of the rom file (the one set in the addon preferences by default),
+# there is one instance per path. It's loaded again if the file changed
 def load(filename=None):
     if not filename:
+        # the addon preferences need Blender, only import them when they're used
+        from pd_blendtools import pd_addonprefs as pdp
         filename = pdp.rompath()
 
-    return Romdata(filename)
+    path = os.path.realpath(filename)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    if path not in _roms or _roms[path][0] != key:
+        _roms[path] = (key, Romdata(path))
+
+    return _roms[path][1]
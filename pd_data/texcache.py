@@ -0,0 +1,92 @@
+import os
+import json
+import shutil
+
+from data import binutils as bnu
+from . import texload as tex
+
+
+# on-disk cache of decoded textures, shared by all the .blend files. Entries are keyed by the
+# rom SHA-1, the texture number and the decoder version: each one is the PNG and a json with
+# its texinfo. Once the cache is over maxsize bytes, the least recently used entries are removed.
+# A maxsize of 0 disables the cache
+class TexCache:
+    def __init__(self, path, maxsize):
+        self.path = path
+        self.maxsize = maxsize
+
+    def entry(self, romhash, texnum):
+        base = os.path.join(self.path, romhash, f'{texnum:04x}.v{tex.TEXLOAD_VERSION}')
+        return f'{base}.png', f'{base}.json'
+
+    # returns the path of the cached image of the texture and its texinfo (None if not cached)
+    def get(self, romhash, texnum):
+        if not self.maxsize: return None
+
+        png, meta = self.entry(romhash, texnum)
+
+        try:
+            with open(meta, 'r') as fd:
+                texinfo = json.load(fd)
+            if not os.path.exists(png):
+                return None
+            # the json modification time is the last use of the entry
+            os.utime(meta)
+        except (OSError, ValueError):
+            return None
+
+        return png, texinfo
+
+    # adds an entry, the image is given as PNG data
+    def put(self, romhash, texnum, pngdata, texinfo):
+        self.put_entry(romhash, texnum, texinfo, lambda png: bnu.write_file(png, pngdata, log=False))
+
+    # adds an entry, the image is copied from the PNG file src
+    def put_file(self, romhash, texnum, src, texinfo):
+        self.put_entry(romhash, texnum, texinfo, lambda png: shutil.copyfile(src, png))
+
+    def put_entry(self, romhash, texnum, texinfo, write_png):
+        if not self.maxsize: return
+
+        png, meta = self.entry(romhash, texnum)
+        os.makedirs(os.path.dirname(png), exist_ok=True)
+
+        try:
+            write_png(png)
+            # the json is written last: an entry is only valid once it exists
+            with open(meta, 'w') as fd:
+                json.dump(texinfo, fd)
+        except OSError as e:
+            print(f'WARNING: unable to cache texture {texnum:04x}: {e}')
+
+    # removes the least recently used entries until the cache fits in maxsize
+    def trim(self):
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                if not filename.endswith('.json'): continue
+
+                meta = os.path.join(dirpath, filename)
+                png = f'{meta[:-5]}.png'
+                try:
+                    size = os.path.getsize(png) + os.path.getsize(meta)
+                    entries.append((os.path.getmtime(meta), size, png, meta))
+                except OSError:
+                    continue
+
+                total += size
+
+        if total <= self.maxsize: return
+
+        entries.sort()
+        for _, size, png, meta in entries:
+            if total <= self.maxsize: break
+
+            for filename in [meta, png]:
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+
+            total -= size
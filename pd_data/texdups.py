@@ -0,0 +1,76 @@
+import hashlib
+
+import numpy as np
+
+from . import texencode as texenc
+
+# finds the duplicated textures of a level: the exact duplicates (same pixels) and the
+# perceptual ones (a close perceptual hash, confirmed by comparing the pixels)
+
+# minimum PSNR (dB) between 2 images to merge them as perceptual duplicates
+TEX_DUP_PSNR = 40
+
+# maximum number of bits that differ between the perceptual hashes of 2 duplicates
+TEX_DUP_HASH_BITS = 6
+
+# the perceptual hash compares the neighbour cells of a grid of this many rows (and 1 more column)
+TEX_DUP_HASH_SIZE = 8
+
+def tex_exact_hash(rgba, w, h):
+    sha = hashlib.sha1(f'{w}x{h}'.encode())
+    sha.update(np.ascontiguousarray(rgba, dtype=np.uint8).tobytes())
+    return sha.hexdigest()
+
+# difference hash of the image: its intensity (premultiplied by alpha) is averaged in
+# TEX_DUP_HASH_SIZE x TEX_DUP_HASH_SIZE+1 cells, each bit tells if a cell is brighter than
+# the one on its left
+def tex_perceptual_hash(rgba, w, h):
+    rgba = np.asarray(rgba, dtype=np.float64).reshape(h, w, 4)
+    intensity = rgba[:, :, 0:3].mean(axis=2) * rgba[:, :, 3] / 255
+
+    rows, cols = TEX_DUP_HASH_SIZE, TEX_DUP_HASH_SIZE + 1
+    cells = np.empty((rows, cols))
+    for y in range(rows):
+        y0 = y * h // rows
+        y1 = max(y0 + 1, (y + 1) * h // rows)
+        for x in range(cols):
+            x0 = x * w // cols
+            x1 = max(x0 + 1, (x + 1) * w // cols)
+            cells[y, x] = intensity[y0:y1, x0:x1].mean()
+
+    bits = (cells[:, 1:] > cells[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+# finds the duplicates among images: {name: (rgba, w, h, kind)}, in order of preference (the
+# first of a set of duplicates is kept). Only the images of the same size and kind (ex: the
+# texture format) are compared. Returns {name: name of the image it duplicates}
+def tex_find_duplicates(images, psnr=TEX_DUP_PSNR, hashbits=TEX_DUP_HASH_BITS):
+    groups = {}
+    for name, (_, w, h, kind) in images.items():
+        groups.setdefault((w, h, kind), []).append(name)
+
+    dups = {}
+    for names in groups.values():
+        exact = {}
+        kept = []
+
+        for name in names:
+            rgba, w, h, _ = images[name]
+            digest = tex_exact_hash(rgba, w, h)
+            if digest in exact:
+                dups[name] = exact[digest]
+                continue
+
+            phash = tex_perceptual_hash(rgba, w, h)
+            dup = next((keptname for keptname, keptphash in kept
+                        if bin(phash ^ keptphash).count('1') <= hashbits
+                        and texenc.tex_psnr(images[keptname][0], rgba) >= psnr), None)
+
+            if dup is None:
+                kept.append((name, phash))
+                exact[digest] = name
+            else:
+                dups[name] = dup
+                exact[digest] = dup
+
+    return dups
@@ -0,0 +1,408 @@
+import math
+
+import numpy as np
+
+from data import binutils as bnu
+from data.bitwriter import BitWriter
+from data import img_utils as imu
+from . import texload as tex
+
+# encodes images to the texture formats of the game, the reverse of texload. Each
+# candidate encoding is decoded back with texload, so only what it can read is produced
+
+# minimum PSNR (in dB, over the RGBA channels) of an encoding, compared to the source
+TEX_ENCODE_PSNR = 30
+
+# the formats tried by tex_encode
+TexEncodeFormats = [
+    tex.PDFORMAT_RGBA16,
+    tex.PDFORMAT_IA8,
+    tex.PDFORMAT_I4,
+    tex.PDFORMAT_RGBA16_CI8,
+    tex.PDFORMAT_RGBA16_CI4,
+]
+
+# the compressions tried for each format (None: zlib). texload only reads the paletted
+# formats from zlib data, and the I4 lookup (2 pixels per byte) isn't what the images use
+TexEncodeCompressions = {
+    tex.PDFORMAT_RGBA16:     [tex.PDCOMPRESSION_RLE, tex.PDCOMPRESSION_LOOKUP, tex.PDCOMPRESSION_RLELOOKUP],
+    tex.PDFORMAT_IA8:        [tex.PDCOMPRESSION_RLE, tex.PDCOMPRESSION_LOOKUP, tex.PDCOMPRESSION_RLELOOKUP],
+    tex.PDFORMAT_I4:         [tex.PDCOMPRESSION_RLE, tex.PDCOMPRESSION_RLELOOKUP],
+    tex.PDFORMAT_RGBA16_CI8: [None],
+    tex.PDFORMAT_RGBA16_CI4: [None],
+}
+
+# the RLE back reference and run length fields are at most 7 bits
+TEX_RLE_MAXFIELD = 7
+
+# number of k-means passes refining the median cut palettes
+TEX_PALETTE_ITERATIONS = 3
+
+# the values rounded to the nearest multiple of scale (the decoders expand v to v * scale)
+def tex_quantize(values, scale, maxval):
+    return np.clip(np.rint(values / scale), 0, maxval).astype(np.int64)
+
+# the channels of the RGBA pixels in format fmt, as a (numchannels, w*h) array.
+# The RGBA16 alpha bit is the 4th channel
+def tex_channels(rgba, fmt):
+    rgba = rgba.astype(np.int64)
+    intensity = rgba[:, 0:3].sum(axis=1) / 3
+
+    if fmt == tex.PDFORMAT_RGBA16:
+        r, g, b = [tex_quantize(rgba[:, c], 8, 31) for c in range(3)]
+        return np.stack([r, g, b, (rgba[:, 3] >= 128).astype(np.int64)])
+    elif fmt == tex.PDFORMAT_IA8:
+        return np.stack([tex_quantize(intensity, 16, 15), tex_quantize(rgba[:, 3], 16, 15)])
+    elif fmt == tex.PDFORMAT_I4:
+        return np.stack([tex_quantize(intensity, 16, 15)])
+
+    raise Exception(f'tex_channels: unsupported format {fmt}')
+
+# the pixels as single values of TexFormatBitsPerPixel[fmt] bits
+def tex_pixel_values(channels, fmt):
+    if fmt == tex.PDFORMAT_RGBA16:
+        r, g, b, a = channels
+        return r << 11 | g << 6 | b << 1 | a
+    elif fmt == tex.PDFORMAT_IA8:
+        i, a = channels
+        return i << 4 | a
+
+    return channels[0]
+
+# the RGBA16 values as 8 bit RGBA, like the decoder expands them
+def tex_rgba16_colors(values):
+    r = (values >> 11) & 0x1f
+    g = (values >> 6) & 0x1f
+    b = (values >> 1) & 0x1f
+    return np.stack([r * 8, g * 8, b * 8, (values & 1) * 255], axis=1).astype(np.float64)
+
+# index of the nearest color of palette for each of the colors (float RGBA arrays)
+def tex_nearest(colors, palette):
+    nearest = np.empty(len(colors), dtype=np.int64)
+    step = 4096
+    for i in range(0, len(colors), step):
+        dist = ((colors[i:i+step, None, :] - palette[None, :, :]) ** 2).sum(axis=2)
+        nearest[i:i+step] = dist.argmin(axis=1)
+
+    return nearest
+
+# sum of squared errors of a box of colors to its (weighted) mean, and the variance per channel
+def tex_box_error(colors, counts):
+    mean = np.average(colors, axis=0, weights=counts)
+    var = np.average((colors - mean) ** 2, axis=0, weights=counts)
+    return var.sum() * counts.sum(), var
+
+# reduces the colors of the image to at most maxcolors with a median cut refined by a few
+# k-means passes. Returns (palette, index of each pixel), the palette entries are RGBA16 values
+def tex_palette(rgba, maxcolors):
+    values = tex_pixel_values(tex_channels(rgba, tex.PDFORMAT_RGBA16), tex.PDFORMAT_RGBA16)
+    uniq, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+
+    if len(uniq) <= maxcolors:
+        return uniq, inverse
+
+    colors = tex_rgba16_colors(uniq)
+
+    # split the box with the largest error along its channel of largest variance,
+    # at the weighted median
+    boxes = [(tex_box_error(colors, counts)[0], np.arange(len(uniq)))]
+    while len(boxes) < maxcolors:
+        splittable = [i for i, (err, idx) in enumerate(boxes) if len(idx) > 1 and err > 0]
+        if not splittable: break
+
+        _, idx = boxes.pop(max(splittable, key=lambda i: boxes[i][0]))
+        _, var = tex_box_error(colors[idx], counts[idx])
+        idx = idx[np.argsort(colors[idx, var.argmax()], kind='stable')]
+
+        cum = np.cumsum(counts[idx])
+        mid = int(np.clip(np.searchsorted(cum, cum[-1] / 2) + 1, 1, len(idx) - 1))
+        for half in [idx[:mid], idx[mid:]]:
+            boxes.append((tex_box_error(colors[half], counts[half])[0], half))
+
+    centers = np.array([np.average(colors[idx], axis=0, weights=counts[idx]) for _, idx in boxes])
+
+    for _ in range(TEX_PALETTE_ITERATIONS):
+        nearest = tex_nearest(colors, centers)
+        weights = np.bincount(nearest, weights=counts, minlength=len(centers))
+        used = weights > 0
+        for c in range(4):
+            sums = np.bincount(nearest, weights=colors[:, c] * counts, minlength=len(centers))
+            centers[used, c] = sums[used] / weights[used]
+
+    # the centers as RGBA16 values
+    channels = tex_channels(np.clip(np.rint(centers), 0, 255), tex.PDFORMAT_RGBA16)
+    palette = np.unique(tex_pixel_values(channels, tex.PDFORMAT_RGBA16))
+    nearest = tex_nearest(colors, tex_rgba16_colors(palette))
+
+    return palette, nearest[inverse]
+
+# the RLE block count a run must reach to be encoded, see tex_inflate_rle
+def tex_rle_fudge(btfieldsize, rlfieldsize, blocksize):
+    cost = btfieldsize + rlfieldsize + blocksize + 1
+    return -(-cost // (blocksize + 1))
+
+# the longest match at each block, for the distances up to 2**n (n = 0..TEX_RLE_MAXFIELD):
+# a list of (lengths, distances) indexed by n. The blocks from i are equal to the ones from
+# i - d up to the first mismatch, a run can copy the blocks it writes
+def tex_rle_matches(blocks):
+    n = len(blocks)
+    bestlen = np.zeros(n, dtype=np.int64)
+    bestdist = np.ones(n, dtype=np.int64)
+    matches = []
+
+    for d in range(1, (1 << TEX_RLE_MAXFIELD) + 1):
+        if d < n:
+            eq = blocks[d:] == blocks[:-d]
+            pos = np.arange(len(eq))
+            # the first mismatch from each block
+            ends = np.minimum.accumulate(np.where(eq, len(eq), pos)[::-1])[::-1]
+            length = ends - pos
+
+            better = length > bestlen[d:]
+            bestlen[d:][better] = length[better]
+            bestdist[d:][better] = d
+
+        if d & (d - 1) == 0:
+            matches.append((bestlen.copy(), bestdist.copy()))
+
+    return matches
+
+# greedy parse of the blocks, returns the runs: [(block, runlength, distance)]. The blocks
+# between them are literals, and a run is followed by one. nextstarts is the first block at
+# or after each one whose match is long enough for a run (len(lengths) if none), so the
+# parse jumps from one run to the next
+def tex_rle_parse(lengths, distances, nextstarts, maxrun):
+    runs = []
+    n = len(lengths)
+    start = nextstarts[0] if n else n
+
+    while start < n:
+        length = min(lengths[start], maxrun)
+        runs.append((start, length, distances[start]))
+
+        i = start + length + 1
+        start = nextstarts[i] if i < n else n
+
+    return runs
+
+# a lower bound of the RLE data size (without its header): the blocks no run can reach are
+# literals, the others cost at least a run divided by the blocks of the longest run that can
+# cover them. Only the field sizes whose bound beats the best size found have to be parsed
+def tex_rle_minsize(lengths, fudge, maxrun, blocksize, runcost):
+    n = len(lengths)
+    pos = np.arange(n)
+
+    # the blocks covered by the run starting at each block (its literal included)
+    cover = np.where(lengths >= fudge, np.minimum(lengths, maxrun) + 1, 0)
+
+    # the longest run starting in the maxrun + 1 blocks up to each block
+    longest = cover.copy()
+    width = 1
+    while width < maxrun + 1:
+        step = min(width, maxrun + 1 - width)
+        longest[step:] = np.maximum(longest[step:], longest[:-step])
+        width += step
+
+    reached = np.maximum.accumulate(np.where(cover > 0, pos + cover, 0)) > pos
+    costs = np.where(reached, np.minimum(blocksize + 1, runcost / np.maximum(longest, 1)), blocksize + 1)
+    return costs.sum()
+
+# writes the blocks in the format of tex_inflate_rle, with the field sizes giving the smallest data
+def tex_write_rle(bw, blocks, blocksize):
+    blocks = np.asarray(blocks, dtype=np.int64)
+    n = len(blocks)
+
+    candidates = []
+    matches = {}
+    prevlengths = None
+    for btfieldsize, (lengths, distances) in enumerate(tex_rle_matches(blocks)):
+        # the longer back references only cost more bits if they don't find longer matches
+        if prevlengths is not None and np.array_equal(lengths, prevlengths): continue
+
+        prevlengths = lengths
+        matches[btfieldsize] = (lengths, lengths.tolist(), distances.tolist(), {})
+
+        for rlfieldsize in range(TEX_RLE_MAXFIELD + 1):
+            fudge = tex_rle_fudge(btfieldsize, rlfieldsize, blocksize)
+            maxrun = (1 << rlfieldsize) - 1 + fudge
+            runcost = btfieldsize + rlfieldsize + blocksize + 1
+            minsize = tex_rle_minsize(lengths, fudge, maxrun, blocksize, runcost)
+            candidates.append((minsize, btfieldsize, rlfieldsize))
+
+    # the most promising field sizes are parsed first
+    best = None
+    for minsize, btfieldsize, rlfieldsize in sorted(candidates):
+        if best is not None and minsize > best[0]: break
+
+        lengths, lengthlist, distlist, nextstarts = matches[btfieldsize]
+        fudge = tex_rle_fudge(btfieldsize, rlfieldsize, blocksize)
+        maxrun = (1 << rlfieldsize) - 1 + fudge
+        runcost = btfieldsize + rlfieldsize + blocksize + 1
+
+        if fudge not in nextstarts:
+            pos = np.arange(n)
+            nextstarts[fudge] = np.minimum.accumulate(np.where(lengths >= fudge, pos, n)[::-1])[::-1].tolist()
+
+        runs = tex_rle_parse(lengthlist, distlist, nextstarts[fudge], maxrun)
+
+        # each run covers its blocks and the literal after it, the last one can be past the end
+        covered = 0
+        if runs:
+            runstarts, runlengths, _ = np.array(runs, dtype=np.int64).T
+            covered = int(np.minimum(runlengths + 1, n - runstarts).sum())
+
+        size = (n - covered) * (blocksize + 1) + len(runs) * runcost
+        # on a tie, the smallest field sizes are kept
+        if best is None or (size, btfieldsize, rlfieldsize) < best[:3]:
+            best = (size, btfieldsize, rlfieldsize, runs)
+
+    _, btfieldsize, rlfieldsize, runs = best
+    fudge = tex_rle_fudge(btfieldsize, rlfieldsize, blocksize)
+
+    bw.write(btfieldsize, 3)
+    bw.write(rlfieldsize, 3)
+    bw.write(blocksize, 4)
+
+    values = blocks.tolist()
+    i = 0
+    for start, length, distance in runs + [(n, 0, 0)]:
+        for value in values[i:start]:
+            bw.write(0, 1)
+            bw.write(value, blocksize)
+
+        if start == n: break
+
+        bw.write(1, 1)
+        bw.write(distance - 1, btfieldsize)
+        bw.write(length - fudge, rlfieldsize)
+
+        # the literal after the run, a padding one if the run reaches the end
+        i = start + length
+        bw.write(values[i] if i < n else 0, blocksize)
+        i += 1
+
+# encodes the channels of the image with a non-zlib compression, None if it can't be used
+def tex_encode_nonzlib(fmt, width, height, channels, compression):
+    bw = BitWriter()
+    bw.write(0, 1) # sp14a8
+    bw.write(0, 1) # zlib
+    bw.write(0, 6) # lod
+    bw.write(fmt, 4)
+    bw.write(width, 8)
+    bw.write(height, 8)
+    bw.write(compression, 4)
+
+    if compression == tex.PDCOMPRESSION_RLE:
+        blocks = channels[:tex.TexFormatNumChannels[fmt]].ravel()
+        tex_write_rle(bw, blocks, max(1, int(blocks.max()).bit_length()))
+
+        if tex.TexFormatHas1BitAlpha[fmt]:
+            bw.write_many(channels[3], 1)
+    else:
+        lookup, indices = np.unique(tex_pixel_values(channels, fmt), return_inverse=True)
+        numcolors = len(lookup)
+        if numcolors >= 1 << 11:
+            return None
+
+        bw.write(numcolors, 11)
+        bw.write_many(lookup, tex.TexFormatBitsPerPixel[fmt])
+
+        bitspercolor = tex.tex_get_bit_size(numcolors)
+        if compression == tex.PDCOMPRESSION_LOOKUP:
+            bw.write_many(indices, bitspercolor)
+        else:
+            tex_write_rle(bw, indices.ravel(), max(1, bitspercolor))
+
+    return bw.getbuffer()
+
+# encodes a paletted image, the indices are zlib compressed
+def tex_encode_zlib(fmt, width, height, palette, indices):
+    bw = BitWriter()
+    bw.write(0, 1) # sp14a8
+    bw.write(1, 1) # zlib
+    bw.write(0, 6) # lod
+    bw.write(fmt, 8)
+    bw.write(len(palette) - 1, 8)
+    bw.write_many(palette, 16)
+    bw.write(width, 8)
+    bw.write(height, 8)
+
+    indices = indices.reshape(height, width)
+    if fmt == tex.PDFORMAT_RGBA16_CI4:
+        # 2 pixels per byte, high nibble first. Rows start on a byte boundary
+        rows = np.zeros((height, (width + 1) & ~1), dtype=np.int64)
+        rows[:, :width] = indices
+        indices = rows[:, 0::2] << 4 | rows[:, 1::2]
+
+    return bw.getbuffer() + bnu.compress(indices.astype(np.uint8).tobytes())
+
+# decodes texdata back to RGBA, returns (rgba, texinfo), None if texload can't decode it
+def tex_decode_rgba(texdata):
+    try:
+        texture = tex.tex_decode(texdata)
+        buf, channels = tex.tex_image_data(texture)
+    except Exception:
+        return None
+
+    image = texture.image
+    return imu.rgba32(buf, image.width, image.height, channels), tex.tex_info(texture)
+
+def tex_psnr(rgba, decoded):
+    mse = np.mean((rgba.astype(np.float64) - decoded) ** 2)
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+# encodes the image in format fmt with each of its compressions, returns the smallest
+# as (texdata, decoded rgba, texinfo), None if the image can't be encoded in fmt
+def tex_encode_format(rgba, width, height, fmt):
+    if fmt in [tex.PDFORMAT_RGBA16_CI8, tex.PDFORMAT_RGBA16_CI4]:
+        palette, indices = tex_palette(rgba, 256 if fmt == tex.PDFORMAT_RGBA16_CI8 else 16)
+        candidates = [tex_encode_zlib(fmt, width, height, palette, indices)]
+    else:
+        channels = tex_channels(rgba, fmt)
+        candidates = [tex_encode_nonzlib(fmt, width, height, channels, compression)
+                      for compression in TexEncodeCompressions[fmt]]
+
+    # the candidates all decode to the same pixels
+    for texdata in sorted([c for c in candidates if c is not None], key=len):
+        decoded = tex_decode_rgba(texdata)
+        if decoded is not None:
+            return (texdata, *decoded)
+
+    return None
+
+# encodes the RGBA pixels (8 bits per channel, rows in the order of texload) to the smallest of
+# the formats whose PSNR is at least threshold, the most accurate one if none is. Returns
+# (texdata, texinfo), texinfo has the PSNR of the encoding ('psnr') and whether it reached
+# the threshold ('psnr_ok')
+def tex_encode(pixels, width, height, formats=None, threshold=TEX_ENCODE_PSNR):
+    if not (0 < width < 256 and 0 < height < 256):
+        raise Exception(f'tex_encode: invalid size {width}x{height}, the maximum is 255x255')
+
+    rgba = np.asarray(pixels, dtype=np.uint8).reshape(-1, 4)
+    if len(rgba) < width * height:
+        raise Exception(f'tex_encode: {width * height} pixels needed, {len(rgba)} given')
+
+    rgba = rgba[:width * height]
+
+    results = []
+    for fmt in formats or TexEncodeFormats:
+        res = tex_encode_format(rgba, width, height, fmt)
+        if res is None: continue
+
+        texdata, decoded, texinfo = res
+        results.append((tex_psnr(rgba, decoded), texdata, texinfo))
+
+    if not results:
+        raise Exception('tex_encode: the image can\'t be encoded in any of the formats')
+
+    passing = [res for res in results if res[0] >= threshold]
+    if passing:
+        psnr, texdata, texinfo = min(passing, key=lambda res: len(res[1]))
+    else:
+        psnr, texdata, texinfo = max(results, key=lambda res: (res[0], -len(res[1])))
+
+    texinfo['psnr'] = psnr
+    texinfo['psnr_ok'] = bool(passing)
+
+    return texdata, texinfo
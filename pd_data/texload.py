@@ -1,9 +1,18 @@
+import os
+import heapq
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
-from utils import pd_utils as pdu
+from data import binutils as bnu
 from data.bitreader import BitReader
 from .gbi import *
-from utils import img_utils as imu
+from data import img_utils as imu
+
+# version of the decoder, bump it when a change affects the decoded images
+# so the textures decoded before (see texcache) aren't used anymore
+TEXLOAD_VERSION = 1
 
 # format consts
 PDFORMAT_RGBA32 = 0
@@ -105,14 +114,14 @@ def tex_inflate_zlib(br, sp14a8, lod):
         img.width = br.read(8)
         img.height = br.read(8)
 
-        imgdata = pdu.decompress(br.cur_buffer())
+        imgdata = bnu.decompress(br.cur_buffer())
         tex_align_indices(imgdata, img)
 
     return tex
 
 def tex_inflate_nonzlib(br):
-    scratch = [0] * 0x20000
-    lookup = [0] * 0x10000
+    scratch = np.zeros(0x20000, dtype=np.int64)
+    lookup = np.zeros(0x10000, dtype=np.int64)
     numimages = 1
 
     tex = PDTex()
@@ -126,7 +135,7 @@ def tex_inflate_nonzlib(br):
         img.compression = br.read(4)
 
         fmt, w, h = img.format, img.width, img.height
-        img.colors = [0] * w * h * 4
+        img.colors = np.zeros(w * h * 4, dtype=np.int64)
 
         if img.compression == PDCOMPRESSION_HUFFMAN:
             tex_inflate_huffman(br, scratch, 0, TexFormatNumChannels[fmt]*w*h, TexFormatChannelSizes[fmt])
@@ -186,206 +195,239 @@ def tex_read_alpha_bits(br, dst, img):
     w, h = img.width, img.height
     start = w * h * 3
     count = w * h
-    for i in range(count):
-        dst[start + i] = br.read(1)
+    dst[start:start + count] = br.read_many(1, count)
+
+# writes the decoded values at the start of the pixels buffer
+def tex_store(dst, values):
+    values = values.ravel()
+    if len(values) > len(dst):
+        raise IndexError('tex_store: more pixels than the image size')
+
+    dst[:len(values)] = values
+
+# the decoded channels, stored one after the other, as a (numchannels, w*h) array. The values
+# are int64: the bit operations below aren't masked (ex: g << 6 can overflow a byte)
+def tex_channel_planes(src, img, numchannels):
+    mult = img.width * img.height
+    planes = np.zeros(numchannels * mult, dtype=np.int64)
+    values = src[:numchannels * mult]
+    planes[:len(values)] = values
+    return planes.reshape(numchannels, mult)
 
 def tex_channels_to_pixels(src, img):
     fmt, w, h = img.format, img.width, img.height
     mult = w * h
-    pos = 0
-    row = 0
     dst = img.colors
 
     if fmt == PDFORMAT_RGBA32:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x*4 + 0] = src[pos]
-                dst[row + x*4 + 1] = src[pos + mult]
-                dst[row + x*4 + 2] = src[pos + mult*2]
-                dst[row + x*4 + 3] = src[pos + mult*3]
-                pos += 1
-            row += w*4
+        r, g, b, a = tex_channel_planes(src, img, 4)
+        out = np.stack([r, g, b, a], axis=1)
     elif fmt == PDFORMAT_RGB24:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x*3 + 0] = src[pos]
-                dst[row + x*3 + 1] = src[pos + mult]
-                dst[row + x*3 + 2] = src[pos + mult*2]
-                pos += 1
-            row += w*3
+        r, g, b = tex_channel_planes(src, img, 3)
+        out = np.stack([r, g, b], axis=1)
     elif fmt == PDFORMAT_RGBA16:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x*2 + 0] = src[pos] << 3 | src[pos + mult] >> 2
-                dst[row + x*2 + 1] = src[pos + mult] << 6 | src[pos + mult * 2] << 1 | src[pos + mult * 3]
-                pos += 1
-            row += w*2
+        r, g, b, a = tex_channel_planes(src, img, 4)
+        out = np.stack([r << 3 | g >> 2, g << 6 | b << 1 | a], axis=1)
     elif fmt == PDFORMAT_IA16:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x*2 + 0] = src[pos]
-                dst[row + x*2 + 1] = src[pos + mult]
-                pos += 1
-            row += w*2
+        i, a = tex_channel_planes(src, img, 2)
+        out = np.stack([i, a], axis=1)
     elif fmt == PDFORMAT_RGB15:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x*2 + 0] = src[pos] << 3 | src[pos + mult] >> 2
-                dst[row + x*2 + 1] = src[pos + mult] << 6 | src[pos + mult * 2] << 1 | 1
-                pos += 1
-            row += w*2
+        r, g, b = tex_channel_planes(src, img, 3)
+        out = np.stack([r << 3 | g >> 2, g << 6 | b << 1 | 1], axis=1)
     elif fmt == PDFORMAT_IA8:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x] = src[pos] << 4 | src[pos + mult]
-                pos += 1
-            row += w
+        i, a = tex_channel_planes(src, img, 2)
+        out = i << 4 | a
     elif fmt == PDFORMAT_I8:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x] = src[pos]
-                pos += 1
-            row += w
+        out = tex_channel_planes(src, img, 1)
     elif fmt == PDFORMAT_IA4:
-        for y in range(h):
-            for x in range(0, w, 2):
-                dst[row + x >> 1] = src[pos] << 5 | src[pos + mult * 3] << 4 | src[pos + 1] << 1 | src[pos + mult * 3 + 1]
-                pos += 2
-
-            if w & 1:
-                pos -= 1
-            row += w//2
+        # intensity in the 1st plane, alpha bits in the 4th. The last pixel of an odd row
+        # pairs with the first one of the next row, and the pixel pairs are written to
+        # ((y * (w//2) + x) >> 1), which can hit the same byte more than once
+        planes = np.zeros(mult * 4 + 1, dtype=np.int64)
+        values = src[:mult * 4 + 1]
+        planes[:len(values)] = values
+
+        xs = np.arange(0, w, 2)
+        ys = np.arange(h)[:, None]
+        pos = (ys * w + xs).ravel()
+        idx = ((ys * (w//2) + xs) >> 1).ravel()
+
+        i, a = planes, planes[mult * 3:]
+        out = i[pos] << 5 | a[pos] << 4 | i[pos + 1] << 1 | a[pos + 1]
+
+        # the last write to a byte wins
+        idx, last = np.unique(idx[::-1], return_index=True)
+        dst[idx] = out[::-1][last]
+        return
     elif fmt == PDFORMAT_I4:
-        for i in range(w*h):
-            dst[i] = src[i]
+        out = tex_channel_planes(src, img, 1)
+    else:
+        return
 
-def tex_inflate_huffman(br, dst, dstofs, numiterations, chansize):
-    frequencies = [0] * 2048
-    nodes = [[-1,-1] for _ in range(2048)]
-    done = False
+    tex_store(dst, out)
 
-    # Read the frequencies list
-    for i in range(chansize):
-        frequencies[i] = br.read(8)
+# number of bits decoded with a single lookup by tex_inflate_huffman
+TEX_HUFFMAN_TABLE_BITS = 10
+
+# the 2 smallest frequencies, as (minfreq1, minindex1, minfreq2, minindex2). The encoder finds them
+# with a scan where each frequency smaller than the largest of the 2 kept so far replaces it (the
+# second one when they're equal), so which one ends up 1st depends on the order they're found in.
+# Only the frequencies smaller than the second smallest one before them take part in that, the
+# scan is replayed on those only. runmin and runmin2 are buffers of len(frequencies) + 1
+def tex_huffman_min2(frequencies, runmin, runmin2, minindex1, minindex2):
+    runmin[0] = runmin2[0] = 9999
+    np.minimum.accumulate(frequencies, out=runmin[1:])
+    np.minimum.accumulate(np.maximum(frequencies, runmin[:-1]), out=runmin2[1:])
 
-    # Find the 2 smallest frequencies
     minfreq1 = 9999
     minfreq2 = 9999
-
-    rootindex = 0
-    minindex1 = 0
-    minindex2 = 0
-
-    for i in range(chansize):
-        if frequencies[i] < minfreq1:
-            if minfreq2 < minfreq1:
-                minfreq1 = frequencies[i]
-                minindex1 = i
-            else:
-                minfreq2 = frequencies[i]
-                minindex2 = i
-        elif frequencies[i] < minfreq2:
-            minfreq2 = frequencies[i]
+    for i in np.flatnonzero(frequencies < runmin2[:-1]).tolist():
+        if minfreq2 < minfreq1:
+            minfreq1 = int(frequencies[i])
+            minindex1 = i
+        else:
+            minfreq2 = int(frequencies[i])
             minindex2 = i
 
+    return minfreq1, minindex1, minfreq2, minindex2
+
+# reads the channel values frequencies and builds the tree the same way the encoder did: the
+# codes depend on how it picks and pairs the nodes, so this isn't a regular huffman tree build.
+# A frequency of 9999 or more marks a node as already in the tree
+def tex_huffman_tree(br, chansize):
+    # Read the frequencies list
+    frequencies = np.array([br.read(8) for _ in range(chansize)], dtype=np.int64)
+    runmin = np.empty(chansize + 1, dtype=np.int64)
+    runmin2 = np.empty(chansize + 1, dtype=np.int64)
+
+    # a node is stored in the slot of one of the leaves it joins, or in the first
+    # slot of a leaf which is already in the tree when both are nodes
+    nodes = [[-1,-1] for _ in range(chansize)]
+    freeslots = []
+    isleaf = lambda index: nodes[index][0] < 0 and nodes[index][1] < 0
+
+    rootindex = 0
+    minfreq1, minindex1, minfreq2, minindex2 = tex_huffman_min2(frequencies, runmin, runmin2, 0, 0)
 
     # Build the tree.
-	# For each node in tree, a branch value < 10000 means this branch
-	# leads to another node, and the value is the target node's index.
-	# A branch value >= 10000 means the branch is a leaf node,
-	# and the value is the channel value + 10000.
-    while not done:
-        sumfreq = frequencies[minindex1] + frequencies[minindex2]
+    # For each node in tree, a branch value < 10000 means this branch
+    # leads to another node, and the value is the target node's index.
+    # A branch value >= 10000 means the branch is a leaf node,
+    # and the value is the channel value + 10000.
+    while True:
+        sumfreq = minfreq1 + minfreq2
         if sumfreq == 0: sumfreq = 1
 
         frequencies[minindex1] = 9999
         frequencies[minindex2] = 9999
 
-        if nodes[minindex1][0] < 0 and nodes[minindex1][1] < 0:
+        if isleaf(minindex1):
             nodes[minindex1][0] = minindex1 + 10000
             rootindex = minindex1
             frequencies[minindex1] = sumfreq
 
-            if nodes[minindex2][0] < 0 and nodes[minindex2][1] < 0:
+            if isleaf(minindex2):
                 nodes[minindex1][1] = minindex2 + 10000
+                heapq.heappush(freeslots, minindex2)
             else:
                 nodes[minindex1][1] = minindex2
-        elif nodes[minindex2][0] < 0 and nodes[minindex2][1] < 0:
+        elif isleaf(minindex2):
             nodes[minindex2][0] = minindex2 + 10000
             rootindex = minindex2
             frequencies[minindex2] = sumfreq
-
-            if nodes[minindex1][0] < 0 and nodes[minindex1][1] < 0:
-                nodes[minindex2][1] = minindex1 + 10000
-            else:
-                nodes[minindex2][1] = minindex1
+            nodes[minindex2][1] = minindex1
         else:
-            rootindex = 0
-            while nodes[rootindex][0] >= 0 or \
-                  nodes[rootindex][1] >= 0 or \
-                  frequencies[rootindex] < 9999:
-                rootindex += 1
+            if not freeslots:
+                raise Exception('invalid huffman tree')
 
+            rootindex = heapq.heappop(freeslots)
             frequencies[rootindex] = sumfreq
             nodes[rootindex][0] = minindex1
             nodes[rootindex][1] = minindex2
 
         # Find the two smallest frequencies again for the next iteration
-        minfreq1 = 9999
-        minfreq2 = 9999
-
-        for i in range(chansize):
-            if frequencies[i] < minfreq1:
-                if minfreq1 > minfreq2:
-                    minfreq1 = frequencies[i]
-                    minindex1 = i
-                else:
-                    minfreq2 = frequencies[i]
-                    minindex2 = i
-            elif frequencies[i] < minfreq2:
-                minfreq2 = frequencies[i]
-                minindex2 = i
-
-        if minfreq1 == 9999 or minindex2 == 9999:
-            done = True
-
-    #  Read bits off the bitstring, traverse the tree
-    #  and write the channel values to dst
+        minfreq1, minindex1, minfreq2, minindex2 = tex_huffman_min2(frequencies, runmin, runmin2, minindex1, minindex2)
+
+        if minfreq1 == 9999:
+            return nodes, rootindex
+
+# lookup table of the codes of the tree, indexed by the next 'bits' bits of the stream.
+# Returns bits, values, lengths: values[code] is what the tree walk reaches after reading
+# lengths[code] bits, a leaf (channel value + 10000) or the node to continue from for the
+# codes longer than the table
+def tex_huffman_table(nodes, rootindex):
+    maxdepth = 0
+    stack = [(rootindex, 0)]
+    while stack:
+        index, depth = stack.pop()
+        if index >= 10000:
+            maxdepth = max(maxdepth, depth)
+            continue
+
+        stack.append((nodes[index][0], depth + 1))
+        stack.append((nodes[index][1], depth + 1))
+
+    bits = min(maxdepth, TEX_HUFFMAN_TABLE_BITS)
+    values = [0] * (1 << bits)
+    lengths = [0] * (1 << bits)
+
+    stack = [(rootindex, 0, 0)]
+    while stack:
+        index, code, depth = stack.pop()
+        if index >= 10000 or depth == bits:
+            # all the entries starting with this code
+            first = code << (bits - depth)
+            last = (code + 1) << (bits - depth)
+            values[first:last] = [index] * (last - first)
+            lengths[first:last] = [depth] * (last - first)
+            continue
+
+        stack.append((nodes[index][0], code << 1, depth + 1))
+        stack.append((nodes[index][1], code << 1 | 1, depth + 1))
+
+    return bits, values, lengths
+
+def tex_inflate_huffman(br, dst, dstofs, numiterations, chansize):
+    nodes, rootindex = tex_huffman_tree(br, chansize)
+    bits, values, lengths = tex_huffman_table(nodes, rootindex)
+
+    #  Read bits off the bitstring, a table lookup at a time, and write the channel values to dst
+    out = [0] * numiterations
     for i in range(numiterations):
-        indexorvalue = rootindex
+        code = br.peek(bits)
+        indexorvalue = values[code]
+        br.read(lengths[code])
 
+        # codes longer than the table, walk the rest of the tree
         while indexorvalue < 10000:
-            indexorvalue: int = nodes[indexorvalue][br.read(1)]
+            indexorvalue = nodes[indexorvalue][br.read(1)]
 
-        if chansize <= 256:
-            dst[dstofs + i] = indexorvalue - 10000
-        else:
-            value = indexorvalue - 10000
-            dst[dstofs + 2 * i + 0] = value >> 8
-            dst[dstofs + 2 * i + 1] = value & 0xff
+        out[i] = indexorvalue - 10000
+
+    if chansize <= 256:
+        dst[dstofs:dstofs + numiterations] = out
+    else:
+        out = np.array(out, dtype=np.int64)
+        dst[dstofs:dstofs + 2*numiterations:2] = out >> 8
+        dst[dstofs + 1:dstofs + 2*numiterations:2] = out & 0xff
 
 def tex_build_lookup(br, lookup, bitsperpixel):
     numcolors = br.read(11)
 
+    values = br.read_many(bitsperpixel, numcolors)
+    if bitsperpixel > 24:
+        # the colors are 24 bits followed by the rest: value = (24 bits << 8) | rest
+        lowbits = bitsperpixel - 24
+        values = (values >> lowbits) << 8 | (values & ((1 << lowbits) - 1))
+
     if bitsperpixel <= 16:
-        for i in range(numcolors):
-            value = br.read(bitsperpixel)
-            lookup[2*i + 0] = (value >> 8) & 0xff
-            lookup[2*i + 1] = value & 0xff
-    elif bitsperpixel <= 24:
-        for i in range(numcolors):
-            value = br.read(bitsperpixel)
-            lookup[4*i + 0] = (value >> 24)
-            lookup[4*i + 1] = (value >> 16) & 0xff
-            lookup[4*i + 2] = (value >>  8) & 0xff
-            lookup[4*i + 3] = value & 0xff
+        lookup[0:2*numcolors:2] = (values >> 8) & 0xff
+        lookup[1:2*numcolors:2] = values & 0xff
     else:
-        for i in range(numcolors):
-            value = br.read(24) << 8 | br.read(bitsperpixel - 24)
-            lookup[4*i + 0] = (value >> 24)
-            lookup[4*i + 1] = (value >> 16) & 0xff
-            lookup[4*i + 2] = (value >>  8) & 0xff
-            lookup[4*i + 3] = value & 0xff
+        lookup[0:4*numcolors:4] = values >> 24
+        lookup[1:4*numcolors:4] = (values >> 16) & 0xff
+        lookup[2:4*numcolors:4] = (values >>  8) & 0xff
+        lookup[3:4*numcolors:4] = values & 0xff
 
     return numcolors
 
@@ -404,57 +446,33 @@ def tex_inflate_lookup(br, image, lookup, numcolors):
     fmt, w, h = image.format, image.width, image.height
 
     dst = image.colors
-    dstofs = 0
+    indices = br.read_many(bitspercolor, w * h)
+
     if fmt == PDFORMAT_RGBA32:
-        for y in range(h):
-            for x in range(w):
-                index = br.read(bitspercolor)
-                dst[dstofs + 4*x + 0] = lookup[4*index + 0]
-                dst[dstofs + 4*x + 1] = lookup[4*index + 1]
-                dst[dstofs + 4*x + 2] = lookup[4*index + 2]
-                dst[dstofs + 4*x + 3] = lookup[4*index + 3]
-
-            dstofs += w*4
+        out = lookup.reshape(-1, 4)[indices]
     elif fmt == PDFORMAT_RGB24:
-        for y in range(h):
-            for x in range(w):
-                index = br.read(bitspercolor)
-                dst[dstofs + 3*x + 0] = lookup[4 * index + 1]
-                dst[dstofs + 3*x + 1] = lookup[4 * index + 2]
-                dst[dstofs + 3*x + 2] = lookup[4 * index + 3]
-
-            dstofs += w * 3
+        out = lookup.reshape(-1, 4)[indices, 1:]
     elif fmt in [PDFORMAT_IA16, PDFORMAT_RGBA16]:
-        for y in range(h):
-            for x in range(w):
-                index = br.read(bitspercolor)
-                dst[dstofs + 2*x + 0] = lookup[2 * index + 0]
-                dst[dstofs + 2*x + 1] = lookup[2 * index + 1]
-
-            dstofs += w * 2
+        out = lookup.reshape(-1, 2)[indices]
     elif fmt == PDFORMAT_RGB15:
-        for y in range(h):
-            for x in range(w):
-                index = br.read(bitspercolor)
-                dst[dstofs + 2*x + 0] = lookup[2*index + 0] << 1 | ((lookup[2*index + 1] >> 7) & 1)
-                dst[dstofs + 2*x + 1] = lookup[2*index + 1] << 1 | 1
-
-            dstofs += w * 2
+        hi, lo = lookup.reshape(-1, 2)[indices].T
+        out = np.stack([hi << 1 | ((lo >> 7) & 1), lo << 1 | 1], axis=1)
     elif fmt in [PDFORMAT_IA8, PDFORMAT_I8]:
-        for y in range(h):
-            for x in range(w):
-                dst[dstofs + x] = lookup[br.read(bitspercolor) * 2 + 1]
-
-            dstofs += w
+        out = lookup[indices*2 + 1]
     elif fmt in [PDFORMAT_IA4, PDFORMAT_I4]:
-        for y in range(h):
-            for x in range(0, w, 2):
-                dst[dstofs + (x >> 1)] = lookup[br.read(bitspercolor) * 2] << 4
-
-                if x + 1 < w:
-                    dst[dstofs + (x >> 1)] |= lookup[(br.read(bitspercolor) * 2) + 1]
+        # 2 pixels per byte, the rows are ((w+15) & 0xff0) >> 1 bytes apart
+        stride = ((w+15) & 0xff0) >> 1
+        indices = indices.reshape(h, w)
+        rows = np.zeros((h, stride), dtype=np.int64)
+        rows[:, :(w+1)//2] = lookup[indices[:, 0::2] * 2] << 4
+        rows[:, :w//2] |= lookup[indices[:, 1::2] * 2 + 1]
+
+        # the last row is only written up to its last pixel
+        out = rows.ravel()[:max(0, (h-1)*stride + (w+1)//2)]
+    else:
+        return
 
-            dstofs += ((w+15) & 0xff0) >> 1
+    tex_store(dst, out)
 
 def tex_inflate_rle(br, dst, blockstotal):
     btfieldsize = br.read(3)
@@ -508,103 +526,167 @@ def tex_inflate_rle(br, dst, blockstotal):
 
 def tex_inflate_lookup_from_buffer(src, img, lookup, numcolors):
     fmt, w, h = img.format, img.width, img.height
-    indices = [0] * 0x2000
+    n = w * h
 
     if numcolors <= 256:
-        for i in range(w*h):
-            indices[i] = src[i]
+        indices = np.asarray(src[:n], dtype=np.int64)
     else:
-        for i in range(w*h):
-            indices[i] = (src[2*i + 0] << 8) | src[2*i + 1]
+        values = np.asarray(src[:n*2], dtype=np.int64)
+        indices = values[0::2] << 8 | values[1::2]
 
+    lookup = np.asarray(lookup, dtype=np.int64)
     dst = img.colors
-    row = 0
-    idxofs = 0
+
     if fmt == PDFORMAT_RGBA32:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x*4 + 0] = lookup[indices[idxofs + x]*4 + 0]
-                dst[row + x*4 + 1] = lookup[indices[idxofs + x]*4 + 1]
-                dst[row + x*4 + 2] = lookup[indices[idxofs + x]*4 + 2]
-                dst[row + x*4 + 3] = lookup[indices[idxofs + x]*4 + 3]
-            row += w*4
-            idxofs += w
+        out = lookup.reshape(-1, 4)[indices]
     elif fmt == PDFORMAT_RGB24:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x*3 + 0] = lookup[indices[idxofs + x]*4 + 1]
-                dst[row + x*3 + 1] = lookup[indices[idxofs + x]*4 + 2]
-                dst[row + x*3 + 2] = lookup[indices[idxofs + x]*4 + 3]
-            row += w*3
-            idxofs += w
+        out = lookup.reshape(-1, 4)[indices, 1:]
     elif fmt in [PDFORMAT_RGBA16, PDFORMAT_IA16]:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x*2 + 0] = lookup[indices[idxofs + x]*2 + 0]
-                dst[row + x*2 + 1] = lookup[indices[idxofs + x]*2 + 1]
-            row += w*2
-            idxofs += w
+        out = lookup.reshape(-1, 2)[indices]
     elif fmt == PDFORMAT_RGB15:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x*2 + 0] = lookup[indices[idxofs + x]*2] << 1 | (lookup[indices[idxofs + x]*2 + 1] >> 7)
-                dst[row + x*2 + 1] = lookup[indices[idxofs + x]*2 + 1] << 1 | 1
-            row += w*2
-            idxofs += w
-    elif fmt in [PDFORMAT_IA8, PDFORMAT_I8]:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x] = lookup[indices[idxofs + x]*2 + 1]
-            row += w
-            idxofs += w
-    elif fmt in [PDFORMAT_IA4, PDFORMAT_I4]:
-        for y in range(h):
-            for x in range(w):
-                dst[row + x] = lookup[indices[idxofs + x]*2 + 1]
-            row += w
-            idxofs += w
+        hi, lo = lookup.reshape(-1, 2)[indices].T
+        out = np.stack([hi << 1 | lo >> 7, lo << 1 | 1], axis=1)
+    elif fmt in [PDFORMAT_IA8, PDFORMAT_I8, PDFORMAT_IA4, PDFORMAT_I4]:
+        out = lookup[indices*2 + 1]
+    else:
+        return
+
+    tex_store(dst, out)
+
+# int(values / 2), rounds towards zero
+def tex_halve(values):
+    return np.sign(values) * (np.abs(values) >> 1)
 
 def tex_blur(pixels, width, height, method, chansize):
-    for y in range(height):
-        for x in range(width):
-            cur = pixels[y*width + x] + chansize*2
-            left = pixels[y*width + x - 1] if x > 0 else 0
-            above = pixels[(y-1)*width + x] if y > 0 else 0
-            aboveleft = pixels[(y-1)*width + x - 1] if x > 0 and y > 0 else 0
-
-            if method == 0:
-                pixels[y * width + x] = (cur + left) % chansize
-            elif method == 1:
-                pixels[y * width + x] = (cur + above) % chansize
-            elif method == 2:
-                pixels[y * width + x] = (cur + aboveleft) % chansize
-            elif method == 3:
-                pixels[y * width + x] = (cur + (left + above - aboveleft)) % chansize
-            elif method == 4:
-                pixels[y * width + x] = (cur + (int((above - aboveleft) / 2) + left)) % chansize
-            elif method == 5:
-                pixels[y * width + x] = (cur + (int((left - aboveleft) / 2) + above)) % chansize
-            elif method == 6:
-                pixels[y * width + x] = (cur + (int((left + above) / 2))) % chansize
+    n = width * height
+    if method > 6 or n == 0: return
+
+    cur = np.array(pixels[:n], dtype=np.int64).reshape(height, width) + chansize*2
+
+    # each pixel is predicted from its left/above neighbours, once those are unblurred.
+    # The linear predictors are running sums (mod chansize), the others are computed
+    # a row or an anti-diagonal at a time, from the pixels already done
+    if method == 0:
+        out = np.cumsum(cur, axis=1) % chansize
+    elif method == 1:
+        out = np.cumsum(cur, axis=0) % chansize
+    elif method == 3:
+        out = np.cumsum(np.cumsum(cur, axis=0), axis=1) % chansize
+    elif method in [2, 4]:
+        out = np.empty_like(cur)
+        above = np.zeros(width, dtype=np.int64)
+        aboveleft = np.zeros(width, dtype=np.int64)
+        for y in range(height):
+            if method == 2:
+                out[y] = (cur[y] + aboveleft) % chansize
+            else:
+                out[y] = np.cumsum(cur[y] + tex_halve(above - aboveleft)) % chansize
+
+            above = out[y]
+            aboveleft[1:] = above[:-1]
+    else:
+        # padded with a row above and a column on the left, the neighbours outside the image are 0
+        out = np.zeros((height + 1, width + 1), dtype=np.int64)
+        for d in range(width + height - 1):
+            ys = np.arange(max(0, d - width + 1), min(d, height - 1) + 1)
+            xs = d - ys
+
+            left = out[ys + 1, xs]
+            above = out[ys, xs + 1]
+            aboveleft = out[ys, xs]
+
+            if method == 5:
+                value = cur[ys, xs] + tex_halve(left - aboveleft) + above
+            else:
+                value = cur[ys, xs] + tex_halve(left + above)
+
+            out[ys + 1, xs + 1] = value % chansize
+
+        out = out[1:, 1:]
+
+    pixels[:n] = out.ravel()
 
 def tex_align_indices(imgdata, img):
     fmt, width, height = img.format, img.width, img.height
     if fmt == PDFORMAT_RGBA16_CI8 or fmt == PDFORMAT_IA16_CI8:
         n = width * height
-        img.colors = [imgdata[i] for i in range(n)]
+        img.colors = np.frombuffer(imgdata, dtype=np.uint8, count=n).astype(np.int64)
     elif fmt == PDFORMAT_RGBA16_CI4 or fmt == PDFORMAT_IA4_CI4:
-        row = 0
-        for y in range(height):
-            readside = 0
-            src = imgdata[row:]
-            for x in range(width):
-                value = src[x//2] & 0xf if readside else src[x//2] >> 4
-                img.colors.append(value)
-                readside = 1 - readside
-
-            row += (width+1)//2
+        # 2 pixels per byte, high nibble first. Rows start on a byte boundary
+        stride = (width+1)//2
+        rows = np.frombuffer(imgdata, dtype=np.uint8, count=stride*height).reshape(height, stride)
+        indices = np.empty((height, stride*2), dtype=np.int64)
+        indices[:, 0::2] = rows >> 4
+        indices[:, 1::2] = rows & 0xf
+        img.colors = indices[:, :width].ravel()
 
 def tex_load(filedata, outdir, texid):
+    tex = tex_decode(filedata)
+    tex_write_image(outdir, tex, texid)
+
+    return tex
+
+# the info stored along with each image (Image['texinfo']), needed to export it back
+def tex_info(tex):
+    teximg = tex.image
+    return {
+        'width': teximg.width,
+        'height': teximg.height,
+        'format': teximg.format,
+        'depth': teximg.depth,
+    }
+
+# decodes a texture and writes its image, returns the texture info (None if it couldn't
+# be decoded). This is what the workers of tex_extract_all run, so it receives the
+# texture data instead of the rom
+def tex_extract(texdata, outdir, filename):
+    try:
+        return tex_info(tex_load(texdata, outdir, filename))
+    except Exception as e:
+        print(f'WARNING: unable to decode texture {filename}: {e}')
+        return None
+
+# decodes a texture to 8 bits per channel, returns (texinfo, pixels, numchannels), None if
+# it couldn't be decoded. The images are created from this without going through a file
+def tex_decode_pixels(texdata, name=''):
+    try:
+        tex = tex_decode(texdata)
+        pixels, channels = tex_image_data(tex)
+        return tex_info(tex), bytes(pixels), channels
+    except Exception as e:
+        print(f'WARNING: unable to decode texture {name}: {e}')
+        return None
+
+# runs func(texdata, *args) for each texture in a process pool, returns {texnum: result}
+# for the results that aren't None
+def tex_map(func, romdata, texnums, args, workers):
+    texnums = [texnum for texnum in texnums if texnum in romdata.texoffsets]
+    # the texture data are views into the rom, copied to be sent to the workers
+    texdatas = [bytes(romdata.texturedata(texnum)) for texnum in texnums]
+    args = [[arg(texnum) for texnum in texnums] for arg in args]
+
+    # spawn the workers: forking would copy the whole host process (Blender)
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
+        results = executor.map(func, texdatas, *args, chunksize=16)
+        return {texnum: res for texnum, res in zip(texnums, results) if res is not None}
+
+# decodes the textures of the rom (all of them by default) in a process pool and writes
+# the images to outdir. Returns the info of each texture decoded: {texnum: texinfo}
+def tex_extract_all(romdata, outdir, texnums=None, workers=None):
+    if texnums is None:
+        texnums = romdata.texoffsets.keys()
+
+    os.makedirs(outdir, exist_ok=True)
+
+    args = [lambda texnum: outdir, lambda texnum: f'{texnum:04x}.png']
+    return tex_map(tex_extract, romdata, texnums, args, workers)
+
+# decodes the textures in a process pool, returns {texnum: (texinfo, pixels, numchannels)}
+def tex_decode_all(romdata, texnums, workers=None):
+    return tex_map(tex_decode_pixels, romdata, texnums, [lambda texnum: f'{texnum:04x}'], workers)
+
+def tex_decode(filedata):
     br = BitReader(filedata)
 
     sp14a8 = br.read(1)
@@ -612,13 +694,9 @@ def tex_load(filedata, outdir, texid):
     lod = br.read(6)
 
     if iszlib:
-        tex = tex_inflate_zlib(br, sp14a8, lod)
-    else:
-        tex = tex_inflate_nonzlib(br)
+        return tex_inflate_zlib(br, sp14a8, lod)
 
-    tex_write_image(outdir, tex, texid)
-
-    return tex
+    return tex_inflate_nonzlib(br)
 
 def tex_config_to_format(fmt, depth):
     if fmt == G_IM_FMT_I:
@@ -654,73 +732,65 @@ def tex_config_to_format(fmt, depth):
     return PDFORMAT_I8
 
 
-def flip(image):
-    """Flip image vertically using numpy"""
-
-    width = image.size[0]
-    height = image.size[1]
-    channels = image.channels
-
-    # Get pixels as numpy array
-    pixels = np.array(image.pixels[:])
-
-    # Reshape to image dimensions
-    pixels = pixels.reshape((height, width, channels))
-
-    # Flip vertically
-    pixels = np.flipud(pixels)
-
-    # Flatten and update image
-    image.pixels = pixels.flatten()
-    image.update()
-
-def tex_write_image(outdir, tex, filename):
-    colbuffer = bytearray()
-
+# the images are converted to 8 bits per channel: the conversion function
+# of each format and the number of channels of the result
+TexConversions = {
+    PDFORMAT_RGBA32:     (lambda pixels, n: imu.to_bytes(pixels), 4),
+    PDFORMAT_RGBA16:     (imu.rgba16_to_rgba32, 4),
+    PDFORMAT_RGB24:      (lambda pixels, n: imu.to_bytes(pixels), 3),
+    PDFORMAT_RGB15:      (imu.rgb15_to_rgb24, 3),
+    PDFORMAT_IA8:        (imu.ia8_to_rgba32, 4),
+    PDFORMAT_IA4:        (imu.ia4_to_ia16, 2),
+    PDFORMAT_I8:         (imu.i8_to_rgb24, 3),
+    PDFORMAT_I4:         (imu.i4_to_rgb24, 3),
+    PDFORMAT_RGBA16_CI8: (imu.rgba16_to_rgba32, 4),
+    PDFORMAT_RGBA16_CI4: (imu.rgba16_to_rgba32, 4),
+    PDFORMAT_IA16_CI8:   (imu.ia16_to_rgba32, 4),
+    PDFORMAT_IA4_CI4:    (imu.ia4_to_ia16, 2),
+}
+
+# the pixels of the texture converted to 8 bits per channel, returns (buffer, numchannels)
+def tex_image_data(tex):
     image = tex.image
-    fmt, comp, w, h = image.format, image.compression, image.width, image.height
-
-    copy = lambda pixels, _: bytearray(pixels)
-
-    ConversionFuncs = {
-        PDFORMAT_RGBA32:     (copy, imu.png_rgba32),
-        PDFORMAT_RGBA16:     (imu.rgba16_to_rgba32, imu.png_rgba32),
-        PDFORMAT_RGB24:      (copy, imu.png_rgb24),
-        PDFORMAT_RGB15:      (imu.rgb15_to_rgb24, imu.png_rgb24),
-        PDFORMAT_IA8:        (imu.ia8_to_rgba32, imu.png_rgba32),
-        PDFORMAT_IA4:        (imu.ia4_to_ia16, imu.png_ia16),
-        PDFORMAT_I8:         (imu.i8_to_rgb24, imu.png_rgb24),
-        PDFORMAT_I4:         (imu.i4_to_rgb24, imu.png_rgb24),
-        PDFORMAT_RGBA16_CI8: (imu.rgba16_to_rgba32, imu.png_rgba32),
-        PDFORMAT_RGBA16_CI4: (imu.rgba16_to_rgba32, imu.png_rgba32),
-        PDFORMAT_IA16_CI8:   (imu.ia16_to_rgba32, imu.png_rgba32),
-        PDFORMAT_IA4_CI4:    (imu.ia4_to_ia16, imu.png_ia16),
-    }
+    fmt, w, h = image.format, image.width, image.height
 
-    if fmt not in ConversionFuncs:
+    if fmt not in TexConversions:
         print(f'ERROR: Invalid color format: {fmt}')
 
+    convert, channels = TexConversions[fmt]
     is_paletted = fmt in [PDFORMAT_RGBA16_CI4, PDFORMAT_RGBA16_CI8, PDFORMAT_IA16_CI8, PDFORMAT_IA4_CI4]
 
     if is_paletted:
-        colors = ConversionFuncs[fmt][0](tex.palette, tex.numcolors)
-        for px in image.colors:
-            colbuffer += bytearray([colors[px * 4 + i] for i in range(4)])
-        pngdata = ConversionFuncs[fmt][1](colbuffer, w, h)
+        colors = convert(tex.palette, tex.numcolors)
+        # 4 bytes per pixel, colors[px*4 : px*4 + 4]
+        indices = np.asarray(image.colors, dtype=np.intp)[:, None] * 4 + np.arange(4)
+        colbuffer = np.frombuffer(bytes(colors), dtype=np.uint8)[indices].tobytes()
     else:
-        colbuffer = ConversionFuncs[fmt][0](image.colors, w * h)
-        pngdata = ConversionFuncs[fmt][1](colbuffer, w, h)
+        colbuffer = convert(image.colors, w * h)
+
+    return colbuffer, channels
+
+# the pixels of the texture as RGBA floats, to be set with bpy.types.Image.pixels.foreach_set
+def tex_rgba_float(tex):
+    colbuffer, channels = tex_image_data(tex)
+    return imu.rgba_float(colbuffer, tex.image.width, tex.image.height, channels)
 
-    pdu.write_file(f'{outdir}/{filename}', pngdata, log=False)
+def tex_write_image(outdir, tex, filename, level=imu.PNG_LEVEL):
+    colbuffer, channels = tex_image_data(tex)
+    pngdata = imu.png_encode(colbuffer, tex.image.width, tex.image.height, channels, level)
+    bnu.write_file(f'{outdir}/{filename}', pngdata, log=False)
 
 def tex_set_pixels(teximg, texdata):
     n = len(texdata)
+    data = np.frombuffer(bytes(texdata), dtype=np.uint8).astype(np.int64)
 
     if teximg.format in [PDFORMAT_I4, PDFORMAT_IA4]:
-        teximg.colors = [0] * n * 2
-        for i in range(n):
-            teximg.colors[i] = texdata[i] >> 4
-            teximg.colors[i + 1] = texdata[i] & 0xf
+        # the low nibble of each byte is overwritten by the high one of the next,
+        # only the last one is left (at colors[n])
+        teximg.colors = np.zeros(n * 2, dtype=np.int64)
+        teximg.colors[:n] = data >> 4
+        if n:
+            teximg.colors[n] = data[-1] & 0xf
     elif teximg.format in [PDFORMAT_I8, PDFORMAT_IA8, PDFORMAT_RGBA16,
                            PDFORMAT_RGB15, PDFORMAT_RGBA16, PDFORMAT_RGB15]:
         texsize = teximg.width * teximg.height
@@ -728,6 +798,5 @@ def tex_set_pixels(teximg, texdata):
         #  color data, so to prevent an out-of-bounds access later on, we pad the color list with 0's
         padding = texsize - n if texsize > n else 0
         bpp = 1 if teximg.format in [PDFORMAT_I8, PDFORMAT_IA8] else 2 # bytes per pixel
-        teximg.colors = [0] * (n + padding) * bpp
-        for i in range(n):
-            teximg.colors[i] = texdata[i]
+        teximg.colors = np.zeros((n + padding) * bpp, dtype=np.int64)
+        teximg.colors[:n] = data
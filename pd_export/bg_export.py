@@ -1,6 +1,8 @@
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import math
 import datetime
+import struct
 
 import bpy
 
@@ -26,7 +28,6 @@ def export_rooms(rd, dataout):
     coll = bpy.data.collections['Rooms']
 
     dummyroom = DataBlock.New('bgroom')
-    rd.write_block(dataout, dummyroom)
 
     rooms = [dummyroom]
     for bl_room in coll.objects:
@@ -40,13 +41,11 @@ def export_rooms(rd, dataout):
         pos['x'], pos['y'], pos['z'] = bgu.coord_as_u32(roompos)
         data['br_light_min'] = 0x80
         data['br_light_max'] = 0xff
-        rd.write_block(dataout, data)
 
     endmarker = DataBlock.New('bgroom')
-    rd.write_block(dataout, endmarker)
     rooms.append(endmarker)
 
-    rd.write_block(dataout, dummyroom)
+    rd.write_blocks(dataout, rooms + [dummyroom])
 
     return start, rooms
 
@@ -59,16 +58,19 @@ def export_bgcmds(rd, dataout):
 
     scn = bpy.context.scene
 
+    cmds = []
     for cmd in scn.pd_bgcmds:
         data = DataBlock.New('bgcmd')
         data['type'] = cmd['type']
         data['len'] = cmd['len']
         data['param'] = cmd['param']
-        rd.write_block(dataout, data)
+        cmds.append(data)
 
     endmarker = DataBlock.New('bgcmd')
     endmarker['len'] = 1
-    rd.write_block(dataout, endmarker)
+    cmds.append(endmarker)
+
+    rd.write_blocks(dataout, cmds)
 
     return start
 
@@ -80,6 +82,7 @@ def export_portals(rd, dataout):
 
     R_inv = mtx.rot_blender_inv()
 
+    blocks = []
     portalvertices = []
     idx = 0
     for bl_portal in portals:
@@ -99,37 +102,40 @@ def export_portals(rd, dataout):
         data['verticesoffset'] = idx + 1
         data['roomnum1'] = pd_room1.roomnum
         data['roomnum2'] = pd_room2.roomnum
-
-        rd.write_block(dataout, data)
+        blocks.append(data)
 
         verts = bgu.verts_world(bl_portal, R_inv)
         portalvertices.append(verts)
         idx += 1
 
     endmarker = DataBlock.New('bgportal')
-    rd.write_block(dataout, endmarker)
+    blocks.append(endmarker)
+    rd.write_blocks(dataout, blocks)
 
     export_portalvertices(rd, dataout, portalvertices)
     return start
 
 def export_portalvertices(rd, dataout, portalvertices):
+    decl_name = None
+    blocks = []
     # for verts in portalvertices:
     for idx, verts in enumerate(portalvertices):
         count = len(verts)
-        tpi.TypeInfo.register('portalvertices', decl_portalvertices, False, varmap={'N': count})
-        data = DataBlock.New('portalvertices')
+        decl_name = tpi.TypeInfo.register('portalvertices', decl_portalvertices, False, varmap={'N': count})
+        data = DataBlock.New(decl_name)
         data['count'] = count
         for i, v in enumerate(verts):
             pv = data['vertices'][i]
             pv['x'], pv['y'], pv['z'] = bgu.coord_as_u32(v, round)
 
-        rd.write_block(dataout, data)
+        blocks.append(data)
 
     if len(portalvertices) == 0:
-        tpi.TypeInfo.register('portalvertices', decl_portalvertices, False, varmap={'N': 0})
+        decl_name = tpi.TypeInfo.register('portalvertices', decl_portalvertices, False, varmap={'N': 0})
 
-    endmarker = DataBlock.New('portalvertices')
-    rd.write_block(dataout, endmarker)
+    endmarker = DataBlock.New(decl_name)
+    blocks.append(endmarker)
+    rd.write_blocks(dataout, blocks)
 
 def get_roomblocks(bl_room):
     blocks = []
@@ -216,30 +222,37 @@ def export_roomGDL(roomblocks):
 
     return gfxdata, textures, bbox
 
-def export_roomgfxdata(rd, bl_room, ofs_room):
-    # print('[ROOMGFXDATA]', bl_room.name, f'ofs {ofs_room:08X}')
+# the pointer fields of the room gfx data, relative to the start of the room
+RoomGfxPointers = ['vertices', 'colours', 'opablocks', 'xlublocks']
+RoomBlockPointers = ['next', 'gdl|child', 'vertices|coord1', 'colours']
+
+# bytes reserved after each compressed room, so the size can change a bit once
+# the room is relocated to its final offset without moving the next rooms
+ROOM_COMP_SLACK = 4
+
+# the room is exported at offset 0, the pointers are then moved to the room's offset
+# with relocate_roomgfxdata. Returns the data, the positions of the pointers to relocate,
+# the textures and the bbox
+def export_roomgfxdata(rd, bl_room):
+    # print('[ROOMGFXDATA]', bl_room.name)
     bl_blocks = get_roomblocks(bl_room)
     blockmap = {}
 
     dataout = bytearray()
     header = DataBlock.New('roomgfxdata')
     header['lightsindex'] = -1
-    rd.write_block(dataout, header)
 
     blocks_dl = []
     blocks_bsp = []
 
-    ptr_opa = 0
-    ptr_xlu = 0
-
-    # write room blocks
+    # room blocks
+    roomblocks = []
     for bl_block in bl_blocks:
         pd_room = bl_block.pd_room
 
         block = DataBlock.New('roomblock')
         blockmap[bl_block.name] = block
-
-        ofs_block = len(dataout) + ofs_room
+        roomblocks.append(block)
 
         if pd_room.blocktype == pdprops.BLOCKTYPE_DL:
             block['type'] = 0
@@ -248,27 +261,10 @@ def export_roomgfxdata(rd, bl_room, ofs_room):
             block['type'] = 1
             blocks_bsp.append(bl_block)
 
-        rd.write_block(dataout, block)
-
-        if bl_block['prev']:
-            prev = blockmap[bl_block['prev']]
-            prev.update(dataout, 'next', ofs_block)
-
-        if bl_block['parent']:
-            parent = blockmap[bl_block['parent']]
-            parent.update(dataout, 'gdl|child', ofs_block)
-
-        if ptr_opa == 0 and pd_room.layer == 'opa':
-            ptr_opa = ofs_block
-        if ptr_xlu == 0 and pd_room.layer == 'xlu':
-            ptr_xlu = ofs_block
-
-    header.update(dataout, 'opablocks', ptr_opa)
-    header.update(dataout, 'xlublocks', ptr_xlu)
-
     R_inv = mtx.rot_blender_inv()
 
-    # write coords (from bsp blocks)
+    # coords (from bsp blocks)
+    coords = []
     for bl_block in blocks_bsp:
         pd_room = bl_block.pd_room
         bsp_pos = R_inv @ pd_room.bsp_pos
@@ -276,21 +272,49 @@ def export_roomgfxdata(rd, bl_room, ofs_room):
 
         block_pos = DataBlock.New('coord')
         block_normal = DataBlock.New('coord')
-        ofs_coord = len(dataout) + ofs_room
 
         block_pos['x'], block_pos['y'], block_pos['z'] = bgu.coord_as_u32(bsp_pos)
         block_normal['x'], block_normal['y'], block_normal['z'] = bgu.coord_as_u32(bsp_normal)
+        coords += [block_pos, block_normal]
 
-        rd.write_block(dataout, block_pos)
-        rd.write_block(dataout, block_normal)
+    # the offsets of all the blocks are known upfront, so the pointers
+    # are set before the blocks are written instead of patched afterwards
+    blocks = [header] + roomblocks + coords
+    offsets, end = rd.layout(blocks, 0, 8)
+    ofs_blocks = offsets[1:len(roomblocks)+1]
+    ofs_coords = offsets[len(roomblocks)+1::2]
 
+    ptr_opa = 0
+    ptr_xlu = 0
+
+    for bl_block, ofs in zip(bl_blocks, ofs_blocks):
+        pd_room = bl_block.pd_room
+        ofs_block = ofs
+
+        if bl_block['prev']:
+            prev = blockmap[bl_block['prev']]
+            prev['next'] = ofs_block
+
+        if bl_block['parent']:
+            parent = blockmap[bl_block['parent']]
+            parent['gdl|child'] = ofs_block
+
+        if ptr_opa == 0 and pd_room.layer == 'opa':
+            ptr_opa = ofs_block
+        if ptr_xlu == 0 and pd_room.layer == 'xlu':
+            ptr_xlu = ofs_block
+
+    for bl_block, ofs in zip(blocks_bsp, ofs_coords):
         block = blockmap[bl_block.name]
-        block.update(dataout, 'vertices|coord1', ofs_coord)
+        block['vertices|coord1'] = ofs
+
+    ptr_verts = end
 
-    add_padding(dataout, 8)
+    header['opablocks'] = ptr_opa
+    header['xlublocks'] = ptr_xlu
+    header['vertices'] = ptr_verts
 
-    ptr_verts = ofs_room + len(dataout)
-    header.update(dataout, 'vertices', ptr_verts)
+    rd.write_blocks(dataout, blocks, pad=8)
 
     gfxdata, textures, bbox = export_roomGDL(blocks_dl)
 
@@ -301,7 +325,7 @@ def export_roomgfxdata(rd, bl_room, ofs_room):
     def write_data(idx, field):
         datalist = [e[idx] for e in gfxdata]
         for bl_block, data in zip(blocks_dl, datalist):
-            ofs = len(dataout) + ofs_room
+            ofs = len(dataout)
             datblock = rd.create_block(data)
             rd.write_block_raw(dataout, datblock)
             block = blockmap[bl_block.name]
@@ -314,7 +338,7 @@ def export_roomgfxdata(rd, bl_room, ofs_room):
     ofs_col = write_data(DAT_VTX, 'vertices|coord1')
     write_data(DAT_COLORS, 'colours')
     write_data(DAT_GDL, 'gdl|child')
-    header.update(dataout, 'colours', ofs_col + ofs_room)
+    header.update(dataout, 'colours', ofs_col)
 
     # this weird quirk is needed for animated textures to work: xlu blocks vertices
     # must be the same as the header, the offset goes into the VTX command
@@ -326,9 +350,54 @@ def export_roomgfxdata(rd, bl_room, ofs_room):
 
     add_padding(dataout, 4)
 
-    return dataout, textures, bbox
+    # the header is at 0, so only the null pointers are 0
+    relocs = [block.write_addr + block.codec.offsets[field]
+        for block, fields in [(header, RoomGfxPointers)] + [(b, RoomBlockPointers) for b in roomblocks]
+        for field in fields if block[field]]
+
+    return dataout, relocs, textures, bbox
+
+def relocate_roomgfxdata(roomgfxdata, relocs, ofs_room):
+    data = bytearray(roomgfxdata)
+    for pos in relocs:
+        ptr, = struct.unpack_from('>I', data, pos)
+        struct.pack_into('>I', data, pos, ptr + ofs_room)
+
+    return data
+
+def compress_room(roomgfxdata, relocs, ofs_room, profile):
+    return pdu.compress(relocate_roomgfxdata(roomgfxdata, relocs, ofs_room), profile)
+
+# compresses the rooms ([(roomgfxdata, relocs)]) placed one after the other from ofs_start.
+# The rooms point to their own offset, which depends on the compressed size of the rooms
+# before them: the sizes are first estimated (rooms compressed at ofs_start), then each room
+# gets the estimated size + ROOM_COMP_SLACK. If a room doesn't fit once compressed at its
+# offset, its slot is grown and the rooms after it are compressed again.
+# Returns the compressed rooms and their offsets, the slots are the differences of the offsets
+def compress_rooms(rooms, ofs_start, profile=pdu.COMPRESS_DEFAULT, workers=None):
+    n = len(rooms)
+    with ThreadPoolExecutor(workers) as pool:
+        comps = list(pool.map(lambda room: compress_room(*room, ofs_start, profile), rooms))
+        slots = [pdu.align(len(comp), 4) + ROOM_COMP_SLACK for comp in comps]
 
-def export_section1(out_gfxdatalens, out_bboxes, out_textures):
+        first = 0
+        offsets = [ofs_start] * (n + 1)
+        while first < n:
+            for i in range(first, n):
+                offsets[i+1] = offsets[i] + slots[i]
+
+            comps[first:] = pool.map(lambda i: compress_room(*rooms[i], offsets[i], profile), range(first, n))
+
+            overflow = next((i for i in range(first, n) if pdu.align(len(comps[i]), 4) > slots[i]), n)
+            if overflow < n:
+                slots[overflow] = pdu.align(len(comps[overflow]), 4) + ROOM_COMP_SLACK
+                offsets[overflow+1] = offsets[overflow] + slots[overflow]
+
+            first = overflow + 1
+
+    return comps, offsets
+
+def export_section1(out_gfxdatalens, out_bboxes, out_textures, profile):
     primarydata = bytearray()
     rd = ByteStream(primarydata)
 
@@ -353,31 +422,30 @@ def export_section1(out_gfxdatalens, out_bboxes, out_textures):
     #### patch all gfx data
     gfxdata = bytearray()
 
-    ofs_room = primsize + 0x0f000000
+    # the rooms are exported first (blender data is only read from this thread),
+    # then compressed in parallel
+    roomsgfx = []
     coll = bpy.data.collections['Rooms']
-    idx = 1
     for bl_room in coll.objects:
         if bl_room.pd_obj.type != pdprops.PD_OBJTYPE_ROOM: continue
-        roomgfxdata, textures, bbox = export_roomgfxdata(rd, bl_room, ofs_room)
-        comp = pdu.compress(roomgfxdata)
-        complen = pdu.align(len(comp), 4)
-
-        rooms[idx].update(primarydata, 'unk00', ofs_room)
-
-        ofs_room += complen
-        gfxdata += comp
-        add_padding(gfxdata, 4)
+        roomgfxdata, relocs, textures, bbox = export_roomgfxdata(rd, bl_room)
+        roomsgfx.append((roomgfxdata, relocs))
 
         out_gfxdatalens.append(len(roomgfxdata))
         out_textures |= textures
         out_bboxes.append(bbox)
 
-        idx += 1
+    comps, offsets = compress_rooms(roomsgfx, primsize + 0x0f000000, profile)
+
+    for idx, (comp, ofs_room) in enumerate(zip(comps, offsets)):
+        rooms[idx+1].update(primarydata, 'unk00', ofs_room)
+        gfxdata += comp
+        gfxdata += bytes(offsets[idx+1] - ofs_room - len(comp))
 
-    rooms[idx].update(primarydata, 'unk00', ofs_room)
+    rooms[len(comps)+1].update(primarydata, 'unk00', offsets[-1])
 
     # compress the data and write the headers
-    primarydata_comp = pdu.compress(primarydata)
+    primarydata_comp = pdu.compress(primarydata, profile)
     primcompsize = len(primarydata_comp)
 
     section1 = primarydata_comp + gfxdata
@@ -400,22 +468,29 @@ def export_section1(out_gfxdatalens, out_bboxes, out_textures):
 
     return header + section1
 
-def export_section2(textures):
+def export_section2(textures, profile):
     dataout = bytearray()
     rd = ByteStream(dataout)
 
     scn = bpy.context.scene
+    # merged duplicates (see pdm.merge_texture_ids) share their ID
+    ids = []
     for tex in textures:
         pd_image = tex.pd_image
-        rd.write(dataout, pd_image.id, 's16')
+        if pd_image.id not in ids:
+            ids.append(pd_image.id)
 
-    return pack_section(dataout, mask=0x7fff)
+    for id in ids:
+        rd.write(dataout, id, 's16')
 
-def export_section3(gfxdatalens, bboxes, lights_per_room):
+    return pack_section(dataout, profile, mask=0x7fff)
+
+def export_section3(gfxdatalens, bboxes, lights_per_room, profile):
     dataout = bytearray()
     rd = ByteStream(dataout)
 
     #### bboxes
+    blocks = []
     for bbox in bboxes:
         block = DataBlock.New('bbox')
         block['min_x'] = math.floor(bbox.xmin)
@@ -424,7 +499,9 @@ def export_section3(gfxdatalens, bboxes, lights_per_room):
         block['max_x'] = math.floor(bbox.xmax)
         block['max_y'] = math.floor(bbox.ymax)
         block['max_z'] = math.floor(bbox.zmax)
-        rd.write_block(dataout, block)
+        blocks.append(block)
+
+    rd.write_blocks(dataout, blocks)
 
     #### gfxdatalen
     for gfxdatalen in gfxdatalens:
@@ -434,10 +511,10 @@ def export_section3(gfxdatalens, bboxes, lights_per_room):
     for numlights in lights_per_room:
         rd.write(dataout, numlights, 'u8')
 
-    return pack_section(dataout, 0x7fff)
+    return pack_section(dataout, profile, 0x7fff)
 
-def pack_section(dataout, mask = 1):
-    compdata = pdu.compress(dataout)
+def pack_section(dataout, profile, mask = 1):
+    compdata = pdu.compress(dataout, profile)
     sec2len = len(dataout)
     compsec2len = len(compdata)
 
@@ -448,13 +525,14 @@ def pack_section(dataout, mask = 1):
 
     return header
 
-def export(filename, _):
+# the bg file is always compressed
+def export(filename, _, profile=pdu.COMPRESS_DEFAULT):
     textures = set()
     gfxdatalens = []
     bboxes = []
-    section1 = export_section1(gfxdatalens, bboxes, textures)
-    section2 = export_section2(textures)
-    section3 = export_section3(gfxdatalens, bboxes, [0] * len(gfxdatalens))
+    section1 = export_section1(gfxdatalens, bboxes, textures, profile)
+    section2 = export_section2(textures, profile)
+    section3 = export_section3(gfxdatalens, bboxes, [0] * len(gfxdatalens), profile)
 
     bgdata = section1 + section2 + section3
 
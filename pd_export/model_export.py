@@ -428,7 +428,7 @@ def loadmodel(romdata, modelname=None, filename=None):
     modeldata = romdata.filedata(modelname) if modelname else pdu.read_file(filename)
     return PD_ModelFile(modeldata)
 
-def export_model(model_obj, filename):
+def export_model(model_obj, filename, profile=pdu.COMPRESS_DEFAULT):
     update_log()
     logu.log_clear(logu.LOG_FILE_EXPORT)
 
@@ -512,7 +512,7 @@ def export_model(model_obj, filename):
         model.replace_gdl(modeldata, gdlbytes_opa, idx, opa)
         model.replace_gdl(modeldata, gdlbytes_xlu, idx, xlu)
 
-    modeldata = pdu.compress(modeldata)
+    modeldata = pdu.compress(modeldata, profile)
     pdu.write_file(filename, modeldata)
 
 def print_batches(mesh, tri_batches, matrices=None):
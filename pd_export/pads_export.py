@@ -8,7 +8,7 @@ from utils import (
 )
 from pd_blendprops import WAYPOINT_EDGEVALUES
 from pd_data.decl_padsfile import decl_padsfileheader
-from data.bytestream import ByteStream, add_padding
+from data.bytestream import ByteStream, add_padding, align
 from data.datablock import DataBlock
 from data.typeinfo import TypeInfo
 import pd_blendprops as pdprops
@@ -255,11 +255,17 @@ def export_waypoints(dataout, waypoints):
         block['padnum'] = pd_prop.padnum
         block['groupnum'] = pd_waypoint.groupnum
         wp_blocks.append(block)
-        rd.write_block(dataout, block)
 
     wp_end = DataBlock.New('waypoint')
     wp_end['padnum'] = -1
-    rd.write_block(dataout, wp_end)
+
+    # the neighbours lists follow the blocks, each one ends with a -1 (u32)
+    _, ofs = rd.layout(wp_blocks + [wp_end], len(dataout))
+    for block, bl_waypoint in zip(wp_blocks, waypoints):
+        block['neighbours'] = ofs
+        ofs += (len(bl_waypoint.pd_waypoint.neighbours_coll) + 1) * 4
+
+    rd.write_blocks(dataout, wp_blocks + [wp_end])
 
     # write neighbours
     id2idx = {wp.pd_waypoint.id: wp.pd_waypoint.idx for wp in waypoints}
@@ -270,7 +276,6 @@ def export_waypoints(dataout, waypoints):
         pd_waypoint = bl_waypoint.pd_waypoint
         # print(bl_waypoint.name, f'{pd_waypoint.groupnum:02X}')
         # print(f'WP #{idx:02X} neighbours {len(dataout):08X}')
-        wp_blocks[idx].update(dataout, 'neighbours', len(dataout))
         for neighbour in pd_waypoint.neighbours_coll:
             edge = neighbour.edgetype
             edgevalue = pdprops.WAYPOINT_EDGEVALUES[edge] << 8
@@ -296,11 +301,9 @@ def export_waygroups(dataout):
     for _ in enumerate(groups):
         block = DataBlock.New('waygroup')
         wg_blocks.append(block)
-        rd.write_block(dataout, block)
 
     wg_end = DataBlock.New('waypoint')
     wg_end['neighbours'] = 0
-    rd.write_block(dataout, wg_end)
 
     for groupnum, bl_group in enumerate(groups):
         neighbours = set()
@@ -326,9 +329,21 @@ def export_waygroups(dataout):
         # str_nb = ''.join(str([f'{g:04X}'for g in groups_neighbours[groupnum]]))
         # print(f'group {groupnum:02X}: {str_nb}')
 
+    # the waypoints and neighbours lists follow the blocks, each one ends with a -1 (u32)
+    _, ofs = rd.layout(wg_blocks + [wg_end], len(dataout))
+    for groupnum, block in enumerate(wg_blocks):
+        block['waypoints'] = ofs
+        ofs += (len(groups_waypoints[groupnum]) + 1) * 4
+
+    ofs = align(ofs, 4)
+    for groupnum, block in enumerate(wg_blocks):
+        block['neighbours'] = ofs
+        ofs += (len(groups_neighbours[groupnum]) + 1) * 4
+
+    rd.write_blocks(dataout, wg_blocks + [wg_end])
+
     # export waypoints
     for groupnum, block in enumerate(wg_blocks):
-        block.update(dataout, 'waypoints', len(dataout))
         waypoints = groups_waypoints[groupnum]
         for wp in waypoints:
             rd.write(dataout, wp, 's32')
@@ -338,7 +353,6 @@ def export_waygroups(dataout):
 
     # export neighbours
     for groupnum, block in enumerate(wg_blocks):
-        block.update(dataout, 'neighbours', len(dataout))
         neighbours = groups_neighbours[groupnum]
         for wp in neighbours:
             rd.write(dataout, wp, 's32')
@@ -349,6 +363,7 @@ def export_covers(dataout):
 
     covers = get_objs('Cover Pads', pdprops.PD_OBJTYPE_COVER)
 
+    blocks = []
     for bl_cover in covers:
         block = DataBlock.New('cover')
         B = mtx.rot_blender_inv()
@@ -362,8 +377,9 @@ def export_covers(dataout):
 
         bpos['x'], bpos['y'], bpos['z'] = bgu.coord_as_u32(pos)
         blook['x'], blook['y'], blook['z'] = bgu.coord_as_u32(look)
+        blocks.append(block)
 
-        rd.write_block(dataout, block)
+    rd.write_blocks(dataout, blocks)
 
 def add_lift_stops(props):
     def add_stop(stop, idx):
@@ -396,7 +412,7 @@ def get_objs(collname, objtype):
     objects = lib[collname].objects
     return [prop for prop in objects if pdu.pdtype(prop) == objtype and not prop.hide_render]
 
-def export(filename, compress):
+def export(filename, compress, profile=pdu.COMPRESS_DEFAULT):
     props = get_objs('Props', pdprops.PD_OBJTYPE_PROP)
     intros = get_objs('Intro', pdprops.PD_OBJTYPE_INTRO)
     waypoints = get_objs('Waypoints', pdprops.PD_OBJTYPE_WAYPOINT)
@@ -427,9 +443,9 @@ def export(filename, compress):
 
     numpads = len(all_objs)
     numcovers = len(bpy.data.collections['Cover Pads'].objects)
-    TypeInfo.register('padsfileheader', decl_padsfileheader, varmap={'N': numpads})
+    decl_name = TypeInfo.register('padsfileheader', decl_padsfileheader, varmap={'N': numpads})
 
-    header = DataBlock.New('padsfileheader')
+    header = DataBlock.New(decl_name)
     header['numpads'] = numpads
     header['numcovers'] = numcovers
 
@@ -461,7 +477,7 @@ def export(filename, compress):
     header.update(dataout, 'coversoffset', ofs_covers)
 
     if compress:
-        dataout = pdu.compress(dataout)
+        dataout = pdu.compress(dataout, profile)
 
     filename = pdu.make_dir_bgdata(filename)
     pdu.write_file(filename, dataout)
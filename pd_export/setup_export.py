@@ -16,9 +16,9 @@ def export_intro(rd, dataout):
         padnum = bl_intro.pd_prop.padnum
 
         numargs = cmd_size[cmd] - 1
-        TypeInfo.register('intro', decl_intro_cmd, varmap={'N': numargs})
+        decl_name = TypeInfo.register('intro', decl_intro_cmd, varmap={'N': numargs})
 
-        block = DataBlock.New('intro')
+        block = DataBlock.New(decl_name)
         params = block['params']
         block['cmd'] = cmd
         if cmd == INTROCMD_SPAWN:
@@ -37,7 +37,7 @@ def export_intro(rd, dataout):
 
     rd.write(dataout, ENDMARKER_INTROCMD, 'u32')
 
-def export(filename, compress):
+def export(filename, compress, profile=pdu.COMPRESS_DEFAULT):
     dataout = bytearray()
     bs = ByteStream(None)
 
@@ -59,7 +59,7 @@ def export(filename, compress):
     header.update(dataout, 'paths', ofs_paths)
 
     if compress:
-        dataout = pdu.compress(dataout)
+        dataout = pdu.compress(dataout, profile)
 
     pdu.write_file(filename, dataout)
 
@@ -41,13 +41,9 @@ def export_tile(bl_tile, R_inv, floortypes):
     tileverts = bl_tile.data.vertices
     numvtx = len(tileverts)
 
-    TypeInfo.sizeof.cache_clear()
-    TypeInfo.offsetof.cache_clear()
-    TypeInfo._struct_size.cache_clear()
+    decl_name = TypeInfo.register('geotilei', decl_geotilei, False, varmap={'N': numvtx})
 
-    TypeInfo.register('geotilei', decl_geotilei, False, varmap={'N': numvtx})
-
-    tiledata = DataBlock.New('geotilei')
+    tiledata = DataBlock.New(decl_name)
     tileheader = tiledata['header']
     tileheader['type'] = GEOTYPE_TILE_I
     tileheader['numvertices'] = numvtx
@@ -76,7 +72,7 @@ def export_tile(bl_tile, R_inv, floortypes):
 
     return tiledata
 
-def export(filename, compress):
+def export(filename, compress, profile=pdu.COMPRESS_DEFAULT):
     numrooms = get_numrooms()
     if numrooms == 0: return
 
@@ -88,13 +84,7 @@ def export(filename, compress):
     rd.write(dataout, numrooms+1, 'u32')
 
     # list of offsets where each room's tiles start
-    rooms_ofs = []
-    for _ in range(numrooms+2):
-        room = DataBlock.New('tileroom')
-        rd.write_block(dataout, room)
-        rooms_ofs.append(room)
-
-    rooms_ofs[0].update(dataout, 'ofs', len(dataout))
+    rooms_ofs = [DataBlock.New('tileroom') for _ in range(numrooms+2)]
 
     # build the tile map (roomnum -> [tiles])
     tilemap = {}
@@ -115,20 +105,33 @@ def export(filename, compress):
     floortypes = {e[0].lower(): e[2] for e in pdprops.TILE_FLOORTYPES}
     R_inv = mtx.rot_blender_inv()
 
+    # the tiles of all the rooms, roomtiles[roomnum] is the index of the room's first tile
+    tileblocks = []
+    roomtiles = [0]
     for roomnum in range(1, numrooms + 1):
-        rooms_ofs[roomnum].update(dataout, 'ofs', len(dataout))
+        roomtiles.append(len(tileblocks))
         if roomnum not in tilemap: continue
 
-        # write the tiles vertices
         tiles = tilemap[roomnum]
         for bl_tile in tiles:
-            tiledata = export_tile(bl_tile, R_inv, floortypes)
-            rd.write_block(dataout, tiledata, reread_arraysize=True)
+            tileblocks.append(export_tile(bl_tile, R_inv, floortypes))
+
+    roomtiles.append(len(tileblocks))
+
+    # lay out the tiles after the offsets table to fill it before writing anything
+    _, ofs_tiles = rd.layout(rooms_ofs, len(dataout))
+    offsets, end = rd.layout(tileblocks, ofs_tiles, reread_arraysize=True)
+    offsets.append(end)
+
+    rooms_ofs[0]['ofs'] = ofs_tiles
+    for roomnum in range(1, numrooms + 2):
+        rooms_ofs[roomnum]['ofs'] = offsets[roomtiles[roomnum]]
 
-    rooms_ofs[roomnum+1].update(dataout, 'ofs', len(dataout))
+    rd.write_blocks(dataout, rooms_ofs)
+    rd.write_blocks(dataout, tileblocks, reread_arraysize=True)
 
     if compress:
-        dataout = pdu.compress(dataout)
+        dataout = pdu.compress(dataout, profile)
 
     filename = pdu.make_dir_bgdata(filename)
     pdu.write_file(filename, dataout)
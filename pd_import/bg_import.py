@@ -132,7 +132,7 @@ def bg_loadportals(bgdata, roomrange):
         bl_portal.pd_portal.room2 = rooms[str(room2)]
 
 def loadroom(bgdata, roomnum, tex_configs):
-    room = bgdata.rooms[roomnum]
+    room = bgdata.roomgfx(roomnum)
     gfxdata = room['gfxdata']
 
     vec3 = lambda p: (pdu.f32(p['x']), -pdu.f32(p['z']), pdu.f32(p['y']))
@@ -14,12 +14,15 @@ from pd_data.gbi import *
 from pd_data.decl_model import *
 from data.typeinfo import TypeInfo
 from pd_data import texload as tex
+from pd_data.texcache import TexCache
+from data import img_utils as imu
 from ui import mtxpalette as mtxp
 from utils import (
     pd_utils as pdu,
     log_util as logu,
 )
 from materials import pd_materials as pdm
+from pd_blendtools import pd_addonprefs as pdp
 import pd_blendprops as pdprops
 
 from fast64.f3d import f3d_material as f3dm
@@ -42,6 +45,11 @@ ASSET_TYPE_BG = 'BG'
 ASSET_TYPE_OBJ = 'OBJ'
 ASSET_TYPE_MODEL = 'MODEL'
 
+# info of the rom textures already decoded into the texture dir, by texnum
+extracted_textures = {}
+# below this number of textures to load, it's faster to decode them on the main thread
+PARALLEL_TEX_MIN = 16
+
 PDMeshData = namedtuple('PDMeshData',
                         'opagdl xlugdl ptr_vtx ptr_col vtxdata coldata matrices')
 
@@ -524,6 +532,30 @@ def import_model(romdata, matcache, asset_type, modelname=None, filename=None):
 
     return model_obj, model
 
+# creates an image from the decoded pixels of a texture, without writing it to a file. The
+# image is packed (Blender encodes it), its filepath is where it's written if it's unpacked
+def new_image(imgname, imgpath, pixels, channels, texinfo):
+    w, h = texinfo['width'], texinfo['height']
+
+    img = bpy.data.images.new(imgname, w, h, alpha=channels in [2, 4])
+    img.pixels.foreach_set(imu.rgba_float(pixels, w, h, channels))
+    img.filepath_raw = imgpath
+    img.file_format = 'PNG'
+    img.pack()
+    img['texinfo'] = texinfo
+
+    return img
+
+# loads an image from a file that can go away (the texture cache), so it's packed
+def load_packed_image(imgname, imgpath, filepath, texinfo):
+    img = bpy.data.images.load(filepath)
+    img.pack()
+    img.filepath_raw = imgpath
+    img.name = imgname
+    img['texinfo'] = texinfo
+
+    return img
+
 def loadimages_embedded(model):
     imglib = bpy.data.images
 
@@ -546,36 +578,39 @@ def loadimages_embedded(model):
         if imgname not in imglib:
             texdata = model.texdata[texnum].bytes
             tex.tex_set_pixels(teximg, texdata)
-            tex.tex_write_image(tex_path, pdtex, imgname)
-            img = imglib.load(f'{tex_path}/{imgname}')
-            img['texinfo'] = {
-                'width': teximg.width,
-                'height': teximg.height,
-                'format': teximg.format,
-                'depth': teximg.depth,
-            }
-
-def loadimage(texdata, tex_path, texnum):
-    imglib = bpy.data.images
-    imgname = pdm.imgname(texnum & 0xffff)
-    texture = tex.tex_load(texdata, tex_path, imgname)
-    img = imglib.load(f'{tex_path}/{imgname}')
-
-    teximg = texture.image
-    img['texinfo'] = {
-        'width': teximg.width,
-        'height': teximg.height,
-        'format': teximg.format,
-        'depth': teximg.depth,
-    }
+            pixels, channels = tex.tex_image_data(pdtex)
+            new_image(imgname, f'{tex_path}/{imgname}', pixels, channels, tex.tex_info(pdtex))
 
+def set_image_id(img, texnum):
     # by default don't remap tex IDs for imported maps
-    bl_image = imglib[imgname]
-    pd_image = bl_image.pd_image
+    pd_image = img.pd_image
     pd_image.custom_id = True
     pd_image.id = texnum
     pd_image.id_ui = hex(texnum)
 
+# creates the image of a texture: from the texture dir if it was extracted there (texinfo is
+# given then), otherwise decoded from texdata. Returns the texinfo and the decoded pixels
+# (None if the image was loaded from the file)
+def loadimage(texdata, tex_path, texnum, texinfo=None):
+    imgname = pdm.imgname(texnum & 0xffff)
+    imgpath = f'{tex_path}/{imgname}'
+    decoded = None
+
+    if texinfo is not None and os.path.exists(imgpath):
+        img = bpy.data.images.load(imgpath)
+        img['texinfo'] = texinfo
+    else:
+        decoded = tex.tex_decode_pixels(texdata, imgname)
+        if decoded is None:
+            raise Exception(f'unable to decode texture {texnum:04x}')
+
+        texinfo, pixels, channels = decoded
+        img = new_image(imgname, imgpath, pixels, channels, texinfo)
+
+    set_image_id(img, texnum)
+
+    return texinfo, decoded
+
 def loadimages_external(path, texlist):
     tex_path = pdu.tex_path()
 
@@ -586,10 +621,55 @@ def loadimages_external(path, texlist):
         texdata = pdu.read_file(filename, autodecomp=False)
         loadimage(texdata, tex_path, texnum)
 
+def texcache():
+    return TexCache(pdu.texcache_path(), pdp.texcache_size() * 0x100000)
+
+# adds the textures just extracted into tex_path to the cache
+def cache_textures(romdata, tex_path, texinfos):
+    if not texinfos: return
+
+    cache = texcache()
+    for texnum, texinfo in texinfos.items():
+        cache.put_file(romdata.sha1, texnum, f'{tex_path}/{texnum:04x}.png', texinfo)
+
+    cache.trim()
+
+# adds the textures just decoded to the cache, decoded: {texnum: (texinfo, pixels, numchannels)}
+def cache_decoded(romdata, decoded):
+    cache = texcache()
+    if not decoded or not cache.maxsize: return
+
+    for texnum, (texinfo, pixels, channels) in decoded.items():
+        pngdata = imu.png_encode(pixels, texinfo['width'], texinfo['height'], channels)
+        cache.put(romdata.sha1, texnum, pngdata, texinfo)
+
+    cache.trim()
+
 def loadimages(romdata, texnums):
     imglib = bpy.data.images
     tex_path = pdu.tex_path()
 
+    missing = [
+        texnum for texnum in set(texnums)
+        if not texnum & 0x05000000 and texnum <= 3503 and texnum not in extracted_textures
+        and f'{texnum:04x}.png' not in imglib
+    ]
+
+    # the textures decoded before (in any .blend) are loaded from the cache
+    cache = texcache()
+    cached = {}
+    for texnum in missing:
+        entry = cache.get(romdata.sha1, texnum)
+        if entry is not None:
+            cached[texnum] = entry
+
+    missing = [texnum for texnum in missing if texnum not in cached]
+
+    # decode the others in parallel first, then they only need to be loaded
+    decoded = {}
+    if len(missing) >= PARALLEL_TEX_MIN:
+        decoded = tex.tex_decode_all(romdata, missing)
+
     for texnum in texnums:
         # skip embedded
         if texnum & 0x05000000: continue
@@ -598,13 +678,26 @@ def loadimages(romdata, texnums):
 
         if imgname not in imglib:
             if texnum <= 3503: #TODO temp hack
-                texdata = romdata.texturedata(texnum)
-                loadimage(texdata, tex_path, texnum)
+                imgpath = f'{tex_path}/{imgname}'
+                if texnum in cached:
+                    filepath, texinfo = cached[texnum]
+                    set_image_id(load_packed_image(imgname, imgpath, filepath, texinfo), texnum)
+                elif texnum in decoded:
+                    texinfo, pixels, channels = decoded[texnum]
+                    set_image_id(new_image(imgname, imgpath, pixels, channels, texinfo), texnum)
+                else:
+                    texinfo = extracted_textures.get(texnum)
+                    texdata = romdata.texturedata(texnum) if texinfo is None else None
+                    _, texdecoded = loadimage(texdata, tex_path, texnum, texinfo)
+                    if texdecoded is not None:
+                        decoded[texnum] = texdecoded
                 # print(f'  tex {texnum:02x} loaded')
             else:
                 img = imglib.load(f'{tex_path}/{imgname}')
                 # print(f'  tex {texnum:02x} loaded')
 
+    cache_decoded(romdata, decoded)
+
 def loadmodeldata(romdata, modelname=None, filename=None):
     modeldata = pdu.read_file(filename) if filename else romdata.filedata(modelname)
     model = PD_ModelFile(modeldata)
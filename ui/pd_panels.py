@@ -49,6 +49,10 @@ class PDTOOLS_PT_ImportExport(Panel):
         row = self.layout.row()
         row.operator("pdtools.tex_manage")
 
+        row = self.layout.row()
+        row.enabled = rom_exists
+        row.operator("pdtools.extract_textures")
+
         row = self.layout.row()
         row.operator("pdtools.replacements", text = "Replacements")
 
@@ -1,8 +1,6 @@
-import zlib
 from functools import cache
 from pathlib import Path
 from glob import glob
-import struct
 import os
 import pathlib
 import string
@@ -17,26 +15,13 @@ import addon_utils
 from pd_blendtools import bl_info
 from ui import mtxpalette as mtxp
 
-def decompress(buffer):
-    if buffer[0:2] == b'\x11\x73':
-        return zlib.decompress(buffer[5:], wbits=-15)
-    elif buffer[0:2] == b'\x11\x72':
-        return zlib.decompress(buffer[2:], wbits=-15)
-
-    raise Exception('decompress: invalid header (not 1172 or 1173)')
-
-def decompressandgetunused(buffer):
-    header = int.from_bytes(buffer[0:2], 'big')
-    assert(header == 0x1173)
-    obj = zlib.decompressobj(wbits=-15)
-    bindata = obj.decompress(buffer[5:])
-    return bindata, obj.unused_data
-
-def compress(data):
-    compressor = zlib.compressobj(wbits=-15)
-    stream = compressor.compress(data)
-    stream += compressor.flush()
-    return b'\x11\x73' + len(data).to_bytes(3, 'big') + stream
+# the binary helpers live in data.binutils, which doesn't depend on Blender
+from data.binutils import (
+    decompress, decompressandgetunused, compress,
+    COMPRESS_FAST, COMPRESS_DEFAULT, COMPRESS_MAX,
+    ALIGN8, align, read_file, write_file,
+    s8, s16, s32, f32, u32,
+)
 
 def print_bin(title, data, start, nbytes, group_size=4, groups_per_row=4):
     if title: print(title)
@@ -72,29 +57,6 @@ def _globs(path, *args):
 
     return result
 
-def ALIGN8(addr):
-    return ((addr + 0x7) | 0x7) ^ 0x7
-
-def align(addr, alignment):
-    m = alignment - 1
-    return ((addr + m) | m) ^ m
-
-def read_file(filename, autodecomp=True):
-    with open(filename, 'rb') as fd:
-        data = fd.read()
-
-    if autodecomp and data[0:2] == b'\x11\x73':
-        data = zlib.decompress(data[5:], wbits=-15)
-
-    return data
-
-def write_file(filename, data, log=True):
-    fd = open(f'{filename}', 'wb')
-    fd.write(data)
-    fd.close()
-
-    if log: print(f'file written: {filename}')
-
 def read_tri4(cmd, ofs=0):
     bo = 'big'
     w0 = int.from_bytes(cmd[:4], bo)
@@ -404,21 +366,6 @@ def new_obj(name, parent=None, dsize=50, link=True):
 
     return obj
 
-def s8(value):
-    return struct.unpack('b', value.to_bytes(1, 'little'))[0]
-
-def s16(value):
-    return struct.unpack('h', value.to_bytes(2, 'little'))[0]
-
-def s32(value):
-    return struct.unpack('i', value.to_bytes(4, 'little'))[0]
-
-def f32(value):
-    return struct.unpack('f', value.to_bytes(4, 'little'))[0]
-
-def u32(value):
-    return struct.unpack('I', value.to_bytes(4, 'little'))[0]
-
 @cache
 def addon_path():
     addon_name = bl_info['name']
@@ -439,6 +386,9 @@ def sounds_path():
 def tex_path():
     return f'{assets_path()}/tex'
 
+def texcache_path():
+    return f'{assets_path()}/texcache'
+
 @cache
 def ini_file(filename):
     configs = {}